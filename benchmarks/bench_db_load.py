@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import random
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import LOADERS, create_pool, create_table, db_config, insert_nft_batch
+from gift_parser import NftRecord
+
+BENCH_TABLE = "bench_load"
+
+def make_rows(count: int) -> list:
+    models = [f"Model {i}" for i in range(60)]
+    backdrops = [f"Backdrop {i}" for i in range(80)]
+    symbols = [f"Symbol {i}" for i in range(300)]
+    return [NftRecord(
+        "bench",
+        number,
+        random.choice(models),
+        random.choice(backdrops),
+        random.choice(symbols),
+        random.randint(10, 300),
+        random.randint(10, 300),
+        random.randint(10, 300),
+        "#%06x" % random.randrange(1 << 24),
+        "#%06x" % random.randrange(1 << 24),
+    ) for number in range(1, count + 1)]
+
+async def run(args):
+    rows = make_rows(args.rows)
+    config = db_config()
+    config["local_infile"] = "load_data" in args.modes
+    pool = await create_pool(config)
+    try:
+        for mode in args.modes:
+            for chunk_size in args.chunks:
+                async with pool.acquire() as conn:
+                    async with conn.cursor() as cur:
+                        await cur.execute(f"DROP TABLE IF EXISTS `{BENCH_TABLE}`")
+                await create_table(pool, BENCH_TABLE)
+                inserted = await insert_nft_batch(pool, rows, BENCH_TABLE, mode, chunk_size)
+                updated = await insert_nft_batch(pool, rows, BENCH_TABLE, mode, chunk_size)
+                print(f"{mode:12} chunk {chunk_size:6}: insert {inserted:8.0f} rows/s, upsert {updated:8.0f} rows/s")
+    finally:
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(f"DROP TABLE IF EXISTS `{BENCH_TABLE}`")
+        pool.close()
+        await pool.wait_closed()
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Bulk loader throughput against the configured MySQL")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--modes", nargs="+", choices=sorted(LOADERS), default=sorted(LOADERS))
+    parser.add_argument("--chunks", type=int, nargs="+", default=[500, 1000, 5000])
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import json
+import logging
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from replay import ARCHIVE_DIR, Archive, ReplayServer, synthesize
+
+BENCH_TABLE = "bench_memory"
+
+class _NullCursor:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, args=None):
+        pass
+
+    async def executemany(self, query, args):
+        pass
+
+    async def fetchone(self):
+        return None
+
+    async def fetchall(self):
+        return ()
+
+    async def fetchmany(self, size=None):
+        return ()
+
+class _NullConnection(_NullCursor):
+    def cursor(self, *args):
+        return _NullCursor()
+
+    async def commit(self):
+        pass
+
+class NullPool:
+    # Stands in for the aiomysql pool without MySQL: every statement succeeds and every query comes back
+    # empty, so save_all_to_db runs its own loop and builds the same statements with nothing stored.
+    def acquire(self):
+        return _NullConnection()
+
+async def run_child(archive_dir: Path, size: int) -> dict:
+    # One collection size per process, so ru_maxrss is the peak of this size alone.
+    import bench_replay
+    from collection import Collection
+    from http_client import Fetcher, create_session, get_limiter
+    from main import download_models, process_symbols, save_all_to_db
+
+    logging.getLogger().setLevel(logging.WARNING)
+    limiter = get_limiter()
+    limiter.rate = limiter.max_rate = 100000
+    archive = Archive.load(archive_dir)
+    result = {"size": size}
+
+    async with ReplayServer(archive, total=size) as server, create_session() as session:
+        collection = Collection(archive.name, table_name=BENCH_TABLE, base_url=server.base_url)
+        collection.prepare_dirs()
+        # Crawled pages bypass the response cache, so it stays empty for the whole crawl.
+        fetcher = Fetcher(session)
+
+        try:
+            from database import create_dead_letter_table, create_pool, create_table
+            from rarity import load_rarity_index
+            pool = await create_pool()
+        except Exception as e:
+            result["mysql"] = str(e)
+            stats = await save_all_to_db(NullPool(), fetcher, collection)
+            result["crawl_written"] = stats["written"]
+            result["crawl_rss_mb"] = round(bench_replay.peak_rss_mb(), 1)
+            return result
+
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(f"DROP TABLE IF EXISTS `{BENCH_TABLE}`")
+            await create_table(pool, BENCH_TABLE)
+            await create_dead_letter_table(pool)
+            stats = await save_all_to_db(pool, fetcher, collection)
+            result["crawl_written"] = stats["written"]
+            result["crawl_rss_mb"] = round(bench_replay.peak_rss_mb(), 1)
+            await download_models(pool, fetcher, collection)
+            await process_symbols(pool, fetcher, collection)
+            index = await load_rarity_index(pool, BENCH_TABLE, collection.name)
+            result["indexed"] = len(index)
+            result["db_rss_mb"] = round(bench_replay.peak_rss_mb(), 1)
+        finally:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(f"DROP TABLE IF EXISTS `{BENCH_TABLE}`")
+            pool.close()
+            await pool.wait_closed()
+    return result
+
+def child_main(archive_dir: Path, size: int):
+    import bench_replay
+
+    try:
+        result = asyncio.run(run_child(archive_dir, size))
+    finally:
+        shutil.rmtree(bench_replay.STORAGE_ROOT, ignore_errors=True)
+    print(json.dumps(result))
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Peak RSS of a full crawl as the collection grows; fails if it is not flat")
+    parser.add_argument("--archive", type=Path, default=ARCHIVE_DIR, help="recorded archive; synthesized if missing")
+    parser.add_argument("--synth-count", type=int, default=200, help="pages in a synthesized archive")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 20000, 60000])
+    parser.add_argument("--tolerance", type=float, default=20.0, help="allowed peak RSS growth from the smallest size, MB")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child_main(args.archive, args.child)
+        return
+
+    if not (args.archive / "index.json").exists():
+        synthesize(args.archive, args.synth_count)
+    results = []
+    for size in sorted(args.sizes):
+        out = subprocess.run(
+            [sys.executable, __file__, "--archive", str(args.archive), "--child", str(size)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        results.append(result)
+        db = f"  after DB stages {result['db_rss_mb']:7.1f} MB" if "db_rss_mb" in result else ""
+        print(f"{size:8} items  crawl peak RSS {result['crawl_rss_mb']:7.1f} MB ({result['crawl_written']} written){db}")
+    if "mysql" in results[0]:
+        print(f"MySQL unavailable ({results[0]['mysql']}), crawled through save_all_to_db with a null pool")
+
+    failed = False
+    for key in ("crawl_rss_mb", "db_rss_mb"):
+        if key not in results[0]:
+            continue
+        growth = results[-1][key] - results[0][key]
+        print(f"{key}: +{growth:.1f} MB from {results[0]['size']} to {results[-1]['size']} items (tolerance {args.tolerance:g} MB)")
+        failed |= growth > args.tolerance
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gift_parser import parse_batch
+from bench_parser import FIXTURES_DIR, load_pages
+
+def bench_single(pages: list) -> float:
+    start = time.perf_counter()
+    parse_batch("bench", pages)
+    return len(pages) / (time.perf_counter() - start)
+
+def bench_pool(pages: list, workers: int, chunk: int) -> float:
+    chunks = [pages[i:i + chunk] for i in range(0, len(pages), chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(partial(parse_batch, "bench"), chunks[:workers]))
+        start = time.perf_counter()
+        for _ in executor.map(partial(parse_batch, "bench"), chunks):
+            pass
+        elapsed = time.perf_counter() - start
+    return len(pages) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-core vs process pool parse throughput")
+    parser.add_argument("fixtures", nargs="?", type=Path, default=FIXTURES_DIR)
+    parser.add_argument("--pages", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument("--chunk", type=int, default=64)
+    args = parser.parse_args()
+
+    fixtures = load_pages(args.fixtures)
+    pages = [(i, fixtures[i % len(fixtures)]) for i in range(args.pages)]
+
+    single = bench_single(pages)
+    print(f"1 core: {single:.0f} pages/s")
+    for workers in sorted(set(args.workers)):
+        rate = bench_pool(pages, workers, args.chunk)
+        print(f"{workers} processes (chunk {args.chunk}): {rate:.0f} pages/s ({rate / single:.1f}x)")
+
+if __name__ == "__main__":
+    main()
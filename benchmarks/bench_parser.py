@@ -0,0 +1,35 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gift_parser import parse_gift_page
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+def load_pages(fixtures_dir: Path) -> list:
+    pages = [p.read_bytes() for p in sorted(fixtures_dir.glob("*.html"))]
+    if not pages:
+        raise SystemExit(f"No *.html fixtures in {fixtures_dir}")
+    return pages
+
+def bench(pages: list, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content in pages:
+            parse_gift_page(content)
+    return len(pages) * repeat / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Gift page parser throughput")
+    parser.add_argument("fixtures", nargs="?", type=Path, default=FIXTURES_DIR)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    pages = load_pages(args.fixtures)
+    print(f"{len(pages)} fixtures x {args.repeat}: {bench(pages, args.repeat):.0f} pages/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from renderer import FORMATS, fit, frame_indices, render_model, webp_options
+from replay import ARCHIVE_DIR, synthesize
+
+def render_per_frame(tgs_data: bytes, sizes: list, frames: int, out_dir: Path, fmt: str):
+    # What a caller had to do before: reload the animation for every frame and resize the native render.
+    from rlottie_python import LottieAnimation
+    from PIL import Image
+
+    with LottieAnimation.from_tgs(io.BytesIO(tgs_data)) as anim:
+        width, height = anim.lottie_animation_get_size()
+        total = anim.lottie_animation_get_totalframe()
+    for size in sizes:
+        for frame in frame_indices(total, frames):
+            with LottieAnimation.from_tgs(io.BytesIO(tgs_data)) as anim:
+                buf = anim.lottie_animation_render(frame_num=frame)
+            image = Image.frombuffer("RGBA", (width, height), buf, "raw", "BGRA").resize(fit(width, height, size))
+            options = webp_options() if fmt == "webp" else {}
+            image.save(out_dir / f"{size}_{frame}.{fmt}", format=FORMATS[fmt], **options)
+
+def render_engine(tgs_data: bytes, sizes: list, frames: int, out_dir: Path, fmt: str):
+    render_model(tgs_data, None, {size: out_dir / f"{size}.{fmt}" for size in sizes}, frames, fmt)
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Per-frame reload vs one-pass sprite sheet rendering")
+    parser.add_argument("--archive", type=Path, default=ARCHIVE_DIR, help="recorded archive; synthesized if missing")
+    parser.add_argument("--models", type=int, default=10)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 128])
+    parser.add_argument("--frames", type=int, default=16)
+    parser.add_argument("--format", choices=["webp", "png"], default="webp")
+    args = parser.parse_args()
+
+    if not (args.archive / "index.json").exists():
+        synthesize(args.archive, max(args.models, 10))
+    tgs = [path.read_bytes() for path in sorted((args.archive / "assets").glob("*.tgs"))[:args.models]]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_dir = Path(tmp)
+        start = time.perf_counter()
+        for data in tgs:
+            render_per_frame(data, args.sizes, args.frames, out_dir, args.format)
+        baseline = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for data in tgs:
+            render_engine(data, args.sizes, args.frames, out_dir, args.format)
+        engine = time.perf_counter() - start
+
+    images = len(tgs) * len(args.sizes) * args.frames
+    print(f"per-frame reload: {baseline:.2f}s ({images / baseline:,.0f} frames/s)")
+    print(f"sprite engine:    {engine:.2f}s ({images / engine:,.0f} frames/s), x{baseline / engine:.1f}")
+
+if __name__ == "__main__":
+    main()
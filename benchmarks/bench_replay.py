@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Everything the crawl writes goes to a scratch storage root.
+STORAGE_ROOT = tempfile.mkdtemp(prefix="nft-bench-")
+os.environ["STORAGE_ROOT"] = STORAGE_ROOT
+
+from replay import ARCHIVE_DIR, Archive, ReplayServer, synthesize
+
+BENCH_TABLE = "bench_replay"
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (field, ctypes.c_size_t) for field in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage",
+                )
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 2 ** 20
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+def make_fetcher(session):
+    from http_client import Fetcher
+
+    class TimedFetcher(Fetcher):
+        def __init__(self, session):
+            super().__init__(session)
+            self.latencies = []
+
+        async def _download(self, url: str) -> bytes:
+            started = time.perf_counter()
+            try:
+                return await super()._download(url)
+            finally:
+                self.latencies.append(time.perf_counter() - started)
+
+    return TimedFetcher(session)
+
+async def measure(name: str, session, stage) -> dict:
+    fetcher = make_fetcher(session)
+    started = time.perf_counter()
+    items = await stage(fetcher)
+    elapsed = time.perf_counter() - started
+    latencies = np.array(fetcher.latencies or [0.0]) * 1000
+    result = {
+        "stage": name,
+        "items": items,
+        "seconds": round(elapsed, 3),
+        "items_per_s": round(items / elapsed, 1) if elapsed else 0.0,
+        "requests": len(fetcher.latencies),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    print(
+        f"{name:16} {items:7} items {result['items_per_s']:9.1f}/s  "
+        f"p50 {result['p50_ms']:7.2f}ms  p99 {result['p99_ms']:7.2f}ms  peak RSS {result['peak_rss_mb']:.0f} MB"
+    )
+    return result
+
+async def run(args) -> list:
+    from collection import Collection
+    from http_client import create_session, get_limiter
+    from main import download_models, parse_page, process_symbols, save_all_to_db
+    from settings import get_settings
+    from pipeline import run_pipeline
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings = get_settings()
+    limiter = get_limiter()
+    limiter.rate = limiter.max_rate = args.rate
+    workers = args.workers or settings.workers
+
+    if not (args.archive / "index.json").exists():
+        synthesize(args.archive, args.synth_count)
+    archive = Archive.load(args.archive)
+    results = []
+
+    server = ReplayServer(archive, args.latency, args.jitter, args.error_rate, args.throttle_rate,
+                          args.retry_after, args.items)
+    async with server, create_session() as session:
+        collection = Collection(archive.name, table_name=BENCH_TABLE, base_url=server.base_url)
+        collection.prepare_dirs()
+        print(f"Replaying {len(archive.pages)} recorded pages as {server.total} items from {server.url}")
+
+        async def parse_stage(fetcher):
+            async def discard(batch):
+                pass
+            stats = await run_pipeline(
+                range(1, server.total + 1), partial(parse_page, fetcher, collection), discard,
+                workers=workers, flush_size=settings.batch_size,
+            )
+            return stats["written"]
+
+        results.append(await measure("parse_page", session, parse_stage))
+
+        try:
+            from database import create_dead_letter_table, create_pool, create_table
+            pool = await create_pool()
+        except Exception as e:
+            print(f"MySQL unavailable ({e}), skipping save_all_to_db, download_models and process_symbols")
+            return results
+
+        try:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(f"DROP TABLE IF EXISTS `{BENCH_TABLE}`")
+            await create_table(pool, BENCH_TABLE)
+            await create_dead_letter_table(pool)
+
+            async def save_stage(fetcher):
+                await save_all_to_db(pool, fetcher, collection, workers=workers)
+                return server.total
+
+            async def models_stage(fetcher):
+                await download_models(pool, fetcher, collection)
+                return len(list(collection.img_dir.glob("*.png")))
+
+            async def symbols_stage(fetcher):
+                await process_symbols(pool, fetcher, collection)
+                return len(fetcher.latencies)
+
+            results.append(await measure("save_all_to_db", session, save_stage))
+            results.append(await measure("download_models", session, models_stage))
+            results.append(await measure("process_symbols", session, symbols_stage))
+        finally:
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cur:
+                    await cur.execute(f"DROP TABLE IF EXISTS `{BENCH_TABLE}`")
+            pool.close()
+            await pool.wait_closed()
+    if server.injected["429"] or server.injected["500"]:
+        print(f"Injected {server.injected['429']} 429s and {server.injected['500']} 500s over {server.requests} requests")
+    return results
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="End-to-end crawl throughput against a local replay server")
+    parser.add_argument("--archive", type=Path, default=ARCHIVE_DIR, help="recorded archive; synthesized if missing")
+    parser.add_argument("--synth-count", type=int, default=200, help="pages in a synthesized archive")
+    parser.add_argument("--items", type=int, default=2000, help="numbers to crawl; the archive's pages are reused")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=100000, help="rate limiter ceiling, requests/s")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--json", type=Path, help="also write the results here")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(STORAGE_ROOT, ignore_errors=True)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
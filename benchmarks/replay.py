@@ -0,0 +1,322 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import html
+import io
+import json
+import random
+import re
+import sys
+from pathlib import Path
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+ARCHIVE_DIR = Path(__file__).resolve().parent / "archive"
+
+_QUANTITY = re.compile(rb"(<th>Quantity</th>\s*<td>)[^<]*(</td>)")
+_URL = re.compile(rb"https?://[^\"'\s<>]+")
+
+def _asset_key(url: str) -> str:
+    suffix = "".join(Path(url.split("?")[0]).suffixes[-2:])
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()[:16] + suffix
+
+class Archive:
+    def __init__(self, path, name: str = None, quantity: int = None):
+        self.path = Path(path)
+        self.name = name
+        self.quantity = quantity
+        self.pages = {}
+        self.assets = {}
+
+    @classmethod
+    def load(cls, path) -> "Archive":
+        path = Path(path)
+        with open(path / "index.json", "r", encoding="utf-8") as f:
+            index = json.load(f)
+        archive = cls(path, index["name"], index["quantity"])
+        archive.pages = {int(number): file for number, file in index["pages"].items()}
+        archive.assets = index["assets"]
+        return archive
+
+    def save(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        index = {"name": self.name, "quantity": self.quantity, "pages": self.pages, "assets": self.assets}
+        with open(self.path / "index.json", "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=1)
+
+    def add_page(self, number: int, body: bytes):
+        file = f"pages/{number}.html"
+        (self.path / "pages").mkdir(parents=True, exist_ok=True)
+        (self.path / file).write_bytes(body)
+        self.pages[number] = file
+
+    def add_asset(self, url: str, body: bytes):
+        file = f"assets/{_asset_key(url)}"
+        (self.path / "assets").mkdir(parents=True, exist_ok=True)
+        (self.path / file).write_bytes(body)
+        self.assets[url] = file
+
+    def read(self, file: str) -> bytes:
+        return (self.path / file).read_bytes()
+
+async def record(nft_name: str, numbers, archive_dir, concurrency: int = 16) -> Archive:
+    from collection import Collection
+    from gift_parser import parse_gift_page
+    from http_client import Fetcher, create_session
+
+    class RecordingFetcher(Fetcher):
+        def __init__(self, session):
+            super().__init__(session)
+            self.recorded = {}
+
+        async def _download(self, url: str) -> bytes:
+            data = await super()._download(url)
+            self.recorded[url] = data
+            return data
+
+    collection = Collection(nft_name)
+    archive = Archive(archive_dir, collection.name)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with create_session() as session:
+        fetcher = RecordingFetcher(session)
+
+        async def capture(number):
+            async with semaphore:
+                url = collection.page_url(number)
+                try:
+                    body = await fetcher.get_bytes(url)
+                    page = parse_gift_page(body)
+                    for asset_url in (page.tgs_url, page.pattern_url):
+                        if asset_url:
+                            await fetcher.get_bytes(asset_url)
+                except Exception as e:
+                    print(f"{url}: {e}", file=sys.stderr)
+                    return
+                archive.add_page(number, body)
+                if number == 1:
+                    archive.quantity = page.quantity
+
+        await asyncio.gather(*(capture(n) for n in numbers))
+
+    page_urls = {collection.page_url(n) for n in archive.pages}
+    for url, data in fetcher.recorded.items():
+        if url not in page_urls:
+            archive.add_asset(url, data)
+    archive.quantity = archive.quantity or max(archive.pages, default=0)
+    archive.save()
+    return archive
+
+def _synthetic_tgs(seed: int) -> bytes:
+    rng = random.Random(seed)
+    color = [rng.random(), rng.random(), rng.random(), 1]
+    animation = {
+        "v": "5.5.2", "fr": 60, "ip": 0, "op": 60, "w": 512, "h": 512, "ddd": 0, "assets": [],
+        "layers": [{
+            "ddd": 0, "ind": 1, "ty": 4, "nm": "shape", "sr": 1, "ip": 0, "op": 60, "st": 0, "bm": 0,
+            "ks": {
+                "o": {"a": 0, "k": 100}, "r": {"a": 0, "k": 0}, "p": {"a": 0, "k": [256, 256, 0]},
+                "a": {"a": 0, "k": [0, 0, 0]}, "s": {"a": 0, "k": [100, 100, 100]},
+            },
+            "shapes": [
+                {"ty": "el", "p": {"a": 0, "k": [0, 0]}, "s": {"a": 0, "k": [rng.randint(100, 400)] * 2}},
+                {"ty": "fl", "c": {"a": 0, "k": color}, "o": {"a": 0, "k": 100}},
+            ],
+        }],
+    }
+    return gzip.compress(json.dumps(animation).encode("utf-8"))
+
+def _synthetic_png(seed: int) -> bytes:
+    from PIL import Image
+
+    rng = random.Random(seed)
+    image = Image.new("RGBA", (40, 40), (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255))
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+def synthesize(archive_dir, count: int, models: int = 20, symbols: int = 30, template=None) -> Archive:
+    template = Path(template or FIXTURES_DIR / "plushpepe-1.html").read_text(encoding="utf-8")
+    archive = Archive(archive_dir, "plushpepe", count)
+    rng = random.Random(count)
+    for number in range(1, count + 1):
+        model = rng.randrange(models)
+        symbol = rng.randrange(symbols)
+        tgs_url = f"https://nft.fragment.com/gift/plushpepe-{number}.lottie.json.tgs"
+        pattern_url = f"https://cdn4.telegram-cdn.org/file/pattern-{symbol}.png"
+        body = template
+        body = body.replace("https://nft.fragment.com/gift/plushpepe-1.lottie.json.tgs", tgs_url)
+        body = body.replace("https://cdn4.telegram-cdn.org/file/pattern-illuminati.png", pattern_url)
+        body = body.replace("Kermit <mark>1.5%</mark>", f"Model {model} <mark>{1 + model % 3}%</mark>")
+        body = body.replace("Illuminati <mark>0.2%</mark>", f"Symbol {symbol} <mark>0.{1 + symbol % 9}%</mark>")
+        archive.add_page(number, body.encode("utf-8"))
+        archive.add_asset(tgs_url, _synthetic_tgs(model))
+        if pattern_url not in archive.assets:
+            archive.add_asset(pattern_url, _synthetic_png(symbol))
+    archive.save()
+    return archive
+
+class ReplayServer:
+    def __init__(self, archive: Archive, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, retry_after: float = 1.0, total: int = None,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 0):
+        self.archive = archive
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.total = total or archive.quantity
+        self.host = host
+        self.port = port
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.injected = {"429": 0, "500": 0}
+        self.url = None
+        self._runner = None
+        self._pages = {}
+        self._assets = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.url}/page/{self.archive.name}-"
+
+    def _prepare(self):
+        # Asset links in the recorded pages are pointed at this server so nothing leaves the machine.
+        links = {}
+        for url, file in self.archive.assets.items():
+            key = file.rsplit("/", 1)[-1]
+            self._assets[key] = self.archive.read(file)
+            local = f"{self.url}/asset/{key}".encode("utf-8")
+            links[url.encode("utf-8")] = local
+            links[html.escape(url).encode("utf-8")] = local
+        quantity = f"{self.total}/{self.total} issued".encode("utf-8")
+        for number, file in self.archive.pages.items():
+            body = _URL.sub(lambda m: links.get(m.group(0), m.group(0)), self.archive.read(file))
+            self._pages[number] = _QUANTITY.sub(lambda m: m.group(1) + quantity + m.group(2), body)
+        self._recorded = sorted(self._pages)
+
+    async def _inject(self):
+        self.requests += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self.random.random() * self.jitter)
+        roll = self.random.random()
+        if roll < self.throttle_rate:
+            self.injected["429"] += 1
+            return web.Response(status=429, headers={"Retry-After": str(self.retry_after)})
+        if roll < self.throttle_rate + self.error_rate:
+            self.injected["500"] += 1
+            return web.Response(status=500)
+        return None
+
+    async def _page(self, request):
+        failure = await self._inject()
+        if failure is not None:
+            return failure
+        try:
+            number = int(request.match_info["slug"].rsplit("-", 1)[1])
+        except (IndexError, ValueError):
+            raise web.HTTPNotFound()
+        if number < 1 or number > self.total:
+            raise web.HTTPNotFound()
+        # Past the end of the archive, numbers are served from recorded pages in turn.
+        body = self._pages.get(number) or self._pages[self._recorded[(number - 1) % len(self._recorded)]]
+        return web.Response(body=body, content_type="text/html")
+
+    async def _asset(self, request):
+        failure = await self._inject()
+        if failure is not None:
+            return failure
+        body = self._assets.get(request.match_info["key"])
+        if body is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=body, content_type="application/octet-stream")
+
+    async def start(self) -> "ReplayServer":
+        app = web.Application()
+        app.router.add_get("/page/{slug}", self._page)
+        app.router.add_get("/asset/{key}", self._asset)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        self.url = f"http://{self.host}:{self.port}"
+        self._prepare()
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
+
+def _parse_numbers(value: str) -> list:
+    numbers = []
+    for part in value.split(","):
+        start, _, end = part.partition("-")
+        numbers.extend(range(int(start), int(end or start) + 1))
+    return numbers
+
+async def _serve(args):
+    server = ReplayServer(
+        Archive.load(args.archive), args.latency, args.jitter, args.error_rate,
+        args.throttle_rate, args.retry_after, args.total, args.host, args.port,
+    )
+    async with server:
+        print(f"Replaying `{args.archive}` at {server.base_url}<number>")
+        await asyncio.Event().wait()
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Record gift pages and assets, or replay them from a local server")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="capture pages, .tgs files and pattern PNGs from the live site")
+    rec.add_argument("nft_name")
+    rec.add_argument("--numbers", default="1-100", help="e.g. 1-100 or 1,5,10-20")
+    rec.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    rec.add_argument("--concurrency", type=int, default=16)
+
+    syn = commands.add_parser("synth", help="build an archive from the HTML fixtures with generated assets")
+    syn.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    syn.add_argument("--count", type=int, default=200)
+    syn.add_argument("--models", type=int, default=20)
+    syn.add_argument("--symbols", type=int, default=30)
+
+    srv = commands.add_parser("serve", help="replay an archive over HTTP")
+    srv.add_argument("--archive", type=Path, default=ARCHIVE_DIR)
+    srv.add_argument("--host", default="127.0.0.1")
+    srv.add_argument("--port", type=int, default=8080)
+    srv.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    srv.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    srv.add_argument("--error-rate", type=float, default=0.0, help="share of responses turned into 500s")
+    srv.add_argument("--throttle-rate", type=float, default=0.0, help="share of responses turned into 429s")
+    srv.add_argument("--retry-after", type=float, default=1.0)
+    srv.add_argument("--total", type=int, help="quantity to advertise; numbers past the archive reuse its pages")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        archive = asyncio.run(record(args.nft_name, _parse_numbers(args.numbers), args.archive, args.concurrency))
+        print(f"Recorded {len(archive.pages)} pages and {len(archive.assets)} assets to `{args.archive}`")
+    elif args.command == "synth":
+        archive = synthesize(args.archive, args.count, args.models, args.symbols)
+        print(f"Wrote {len(archive.pages)} pages and {len(archive.assets)} assets to `{args.archive}`")
+    else:
+        try:
+            asyncio.run(_serve(args))
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
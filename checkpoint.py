@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+def _to_ranges(numbers) -> list:
+    ranges = []
+    for n in sorted(numbers):
+        if ranges and n <= ranges[-1][1] + 1:
+            ranges[-1][1] = max(ranges[-1][1], n)
+        else:
+            ranges.append([n, n])
+    return ranges
+
+def _merge(ranges: list) -> list:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+def _subtract(ranges: list, numbers) -> list:
+    # Cut the dropped ranges out of each range instead of expanding it, so the cost follows the
+    # batch size rather than the width of the failed ranges.
+    drop = _to_ranges(numbers)
+    result = []
+    for start, end in ranges:
+        for drop_start, drop_end in drop:
+            if drop_end < start or drop_start > end:
+                continue
+            if drop_start > start:
+                result.append([start, drop_start - 1])
+            start = drop_end + 1
+            if start > end:
+                break
+        if start <= end:
+            result.append([start, end])
+    return result
+
+class Checkpoint:
+    def __init__(self, path: Path, done=None, failed=None, export_size: int = None):
+        self.path = Path(path)
+        self.done = done or []
+        self.failed = failed or []
+        self.export_size = export_size
+
+    @classmethod
+    def load(cls, path: Path) -> "Checkpoint":
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"Checkpoint {path} not found. Starting from scratch.")
+            return cls(path)
+        return cls(path, data.get("done", []), data.get("failed", []), data.get("export_size"))
+
+    def mark_done(self, numbers):
+        numbers = list(numbers)
+        self.done = _merge(self.done + _to_ranges(numbers))
+        if self.failed:
+            self.failed = _subtract(self.failed, numbers)
+
+    def mark_failed(self, numbers):
+        self.failed = _merge(self.failed + _to_ranges(numbers))
+
+    def missing(self, total: int):
+        expected = 1
+        for start, end in self.done:
+            if start > total:
+                break
+            yield from range(expected, start)
+            expected = end + 1
+        yield from range(expected, total + 1)
+
+    def save(self):
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"done": self.done, "failed": self.failed, "export_size": self.export_size}, f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,90 @@
+import json
+from typing import Optional
+
+from export import export_path
+from settings import get_settings
+
+class Collection:
+    def __init__(self, nft_name: str, table_name: str = None, base_url: str = None,
+                 workers: int = None, weight: float = 1.0, export_format: str = None):
+        settings = get_settings()
+        lower = nft_name.lower()
+        self.nft_name = nft_name
+        self.name = lower
+        self.table_name = table_name or settings.table_name.format(NFT_NAME_LOWER=lower)
+        if base_url is None:
+            if not settings.base_url:
+                raise ValueError("Missing BASE_URL")
+            base_url = settings.base_url.format(NFT_NAME_LOWER=lower)
+        self.base_url = base_url
+        self.workers = workers
+        self.weight = weight
+
+        storage_root = settings.storage_root
+        models_root = storage_root / "models" / nft_name
+        self.img_dir = models_root / "img"
+        self.anim_dir = models_root / "anim"
+        self.tgs_dir = models_root / "tgs"
+        self.preview_dir = models_root / "preview"
+        self.patterns_dir = settings.patterns_dir
+        self.export_format = export_format or settings.export_format
+        self.export_path = export_path(storage_root, self.table_name, self.export_format)
+        self.checkpoint_path = storage_root / f"{self.table_name}_checkpoint.json"
+        self.rarity_path = storage_root / f"{self.table_name}_rarity.npz"
+        # First .tgs and pattern URL the crawl saw for each model and symbol, so the asset stages
+        # download them without fetching a sample page again.
+        self.model_urls = {}
+        self.pattern_urls = {}
+
+    def __repr__(self):
+        return f"Collection({self.nft_name!r}, table={self.table_name!r})"
+
+    def page_url(self, number: int) -> str:
+        return self.base_url + str(number)
+
+    def remember_assets(self, record, tgs_url: Optional[str], pattern_url: Optional[str]):
+        if tgs_url:
+            self.model_urls.setdefault(record.m, tgs_url)
+        if pattern_url:
+            self.pattern_urls.setdefault(record.s, pattern_url)
+
+    def prepare_dirs(self):
+        self.img_dir.mkdir(parents=True, exist_ok=True)
+        self.anim_dir.mkdir(parents=True, exist_ok=True)
+        self.tgs_dir.mkdir(parents=True, exist_ok=True)
+        self.preview_dir.mkdir(parents=True, exist_ok=True)
+        self.patterns_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "Collection":
+        nft_name = get_settings().nft_name
+        if not nft_name:
+            raise ValueError("Missing NFT_NAME")
+        return cls(nft_name)
+
+def name_from_table(table_name: str) -> Optional[str]:
+    # Inverts the TABLE_NAME template, for tables that have no rows to read the collection name from yet.
+    prefix, placeholder, suffix = get_settings().table_name.partition("{NFT_NAME_LOWER}")
+    if not placeholder or len(table_name) <= len(prefix) + len(suffix):
+        return None
+    if not (table_name.startswith(prefix) and table_name.endswith(suffix)):
+        return None
+    return table_name[len(prefix):len(table_name) - len(suffix)]
+
+def load_manifest(path) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("collections", []) if isinstance(data, dict) else data
+    collections = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"name": entry}
+        collections.append(Collection(
+            entry["name"],
+            table_name=entry.get("table_name"),
+            base_url=entry.get("base_url"),
+            workers=entry.get("workers"),
+            weight=float(entry.get("weight", 1)),
+            export_format=entry.get("export_format"),
+        ))
+    return collections
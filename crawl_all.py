@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from collection import load_manifest
+from database import create_pool, create_dead_letter_table, create_page_state_table
+from http_client import Fetcher, create_session
+from main import run_collection
+from metrics import report_metrics
+from settings import get_settings
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+def worker_shares(collections, total_workers: int, parallel: int) -> dict:
+    # All collections share one limiter whose slots are handed out in arrival order, so each
+    # collection's share of the request rate follows the number of workers it keeps busy.
+    if not collections:
+        return {}
+    running = min(parallel, len(collections))
+    mean_weight = sum(c.weight for c in collections) / len(collections)
+    shares = {}
+    for c in collections:
+        if c.workers:
+            shares[c.table_name] = c.workers
+        else:
+            shares[c.table_name] = max(1, int(total_workers * c.weight / (running * mean_weight)))
+    return shares
+
+async def crawl_all(collections, resume: bool = False, parallel: int = None, refresh: bool = False):
+    settings = get_settings()
+    parallel = parallel or settings.max_parallel_collections
+    shares = worker_shares(collections, settings.workers, parallel)
+    semaphore = asyncio.Semaphore(parallel)
+    pool = await create_pool()
+    metrics_task = asyncio.create_task(report_metrics())
+    results = {}
+    try:
+        await create_dead_letter_table(pool)
+        await create_page_state_table(pool)
+        async with create_session() as session:
+            fetcher = Fetcher(session)
+            with ProcessPoolExecutor(max_workers=settings.render_workers) as render_executor:
+
+                async def crawl(collection):
+                    async with semaphore:
+                        started = time.time()
+                        workers = shares[collection.table_name]
+                        logger.info(f"[{collection.table_name}] Crawl started with {workers} workers")
+                        try:
+                            await run_collection(pool, fetcher, collection, resume, workers, render_executor, refresh)
+                        except Exception as e:
+                            logger.error(f"[{collection.table_name}] Crawl failed: {e}")
+                            results[collection.table_name] = False
+                            return
+                        logger.info(f"[{collection.table_name}] Crawl finished in {time.time() - started:.2f}s")
+                        results[collection.table_name] = True
+
+                await asyncio.gather(*(crawl(c) for c in collections))
+    finally:
+        metrics_task.cancel()
+        pool.close()
+        await pool.wait_closed()
+    return results
+
+async def main(manifest_path, resume: bool = False, parallel: int = None, refresh: bool = False):
+    parallel = parallel or get_settings().max_parallel_collections
+    start = time.time()
+    collections = load_manifest(manifest_path)
+    logger.info(f"Crawling {len(collections)} collections from `{manifest_path}`, {parallel} at a time")
+    results = await crawl_all(collections, resume, parallel, refresh)
+    failed = [name for name, ok in results.items() if not ok]
+    if failed:
+        logger.error(f"Failed collections: {', '.join(failed)}")
+    logger.info(f"Execution completed in {time.time() - start:.2f}s")
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Crawl every collection listed in a manifest")
+    parser.add_argument("manifest", nargs="?", default=settings.manifest_path, help="JSON list of collections")
+    parser.add_argument("--resume", action="store_true", help="continue each collection from its checkpoint")
+    parser.add_argument("--refresh", action="store_true", help="re-check every page and write only the changed ones")
+    parser.add_argument("--parallel", type=int, default=settings.max_parallel_collections, help="collections crawled at once")
+    args = parser.parse_args()
+    asyncio.run(main(args.manifest, args.resume, max(1, args.parallel), args.refresh))
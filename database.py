@@ -1,28 +1,42 @@
 # database.py
 import aiomysql
+import asyncio
+import logging
 import os
-from dotenv import load_dotenv
-from typing import Any, List
-
-load_dotenv()
-
-db_config = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "user": os.getenv("DB_USER"),
-    "password": os.getenv("DB_PASSWORD"),
-    "db": os.getenv("DB_NAME", "nfts"),
-    "port": int(os.getenv("DB_PORT", 3306)),
-    "charset": "utf8mb4",
-    "autocommit": False,
-}
+import tempfile
+import time
+from typing import Any, List, Optional
+from migrations import SCHEMA_VERSION_TABLE, TRAIT_SUMMARY_TABLE, create_nft_table
+from metrics import DB_LATENCY, DB_ROWS
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_TABLE = "dead_letters"
+PAGE_STATE_TABLE = "page_state"
+INTERNAL_TABLES = {DEAD_LETTER_TABLE, PAGE_STATE_TABLE, SCHEMA_VERSION_TABLE, TRAIT_SUMMARY_TABLE}
 
 required_keys = ["user", "password"]
-for key in required_keys:
-    if not db_config.get(key):
-        raise ValueError(f"Missing DB config: {key}")
 
-async def create_pool() -> aiomysql.Pool:
-    pool = await aiomysql.create_pool(**db_config)
+def db_config() -> dict:
+    settings = get_settings()
+    return {
+        "host": settings.db_host,
+        "user": settings.db_user,
+        "password": settings.db_password,
+        "db": settings.db_name,
+        "port": settings.db_port,
+        "charset": "utf8mb4",
+        "autocommit": False,
+        "local_infile": settings.db_load_mode == "load_data",
+    }
+
+async def create_pool(config: dict = None) -> aiomysql.Pool:
+    config = config or db_config()
+    for key in required_keys:
+        if not config.get(key):
+            raise ValueError(f"Missing DB config: {key}")
+    pool = await aiomysql.create_pool(**config)
     return pool
 
 async def list_tables(pool: aiomysql.Pool) -> List[str]:
@@ -30,58 +44,324 @@ async def list_tables(pool: aiomysql.Pool) -> List[str]:
         async with conn.cursor() as cur:
             await cur.execute("SHOW TABLES")
             rows = await cur.fetchall()
-    return [row[0] for row in rows]
+    return [row[0] for row in rows if row[0] not in INTERNAL_TABLES]
+
+async def read_collection_name(pool: aiomysql.Pool, table_name: str) -> Optional[str]:
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(f"SELECT name FROM `{table_name}` LIMIT 1")
+            row = await cur.fetchone()
+    return row[0] if row else None
 
 async def create_table(pool: aiomysql.Pool, table_name: str):
+    await create_nft_table(pool, table_name)
+
+NFT_COLUMNS = ("name", "number", "m", "bd", "s", "mchance", "bdchance", "schance", "hex1", "hex2", "s_in_dir")
+# Columns that come from the gift page; a refresh compares these to decide whether a row changed.
+NFT_TRAIT_COLUMNS = ("m", "bd", "s", "mchance", "bdchance", "schance", "hex1", "hex2")
+# MySQL applies the assignments left to right, so s_in_dir compares against the old s before s is replaced;
+# a new symbol clears it, and process_symbols picks the row up again.
+NFT_UPSERT = """
+    ON DUPLICATE KEY UPDATE
+        s_in_dir = IF(s <=> VALUES(s), COALESCE(VALUES(s_in_dir), s_in_dir), NULL),
+        m = VALUES(m), bd = VALUES(bd), s = VALUES(s),
+        mchance = VALUES(mchance), bdchance = VALUES(bdchance), schance = VALUES(schance),
+        hex1 = VALUES(hex1), hex2 = VALUES(hex2)
+"""
+
+def _nft_row(record) -> tuple:
+    # Records are gift_parser.NftRecord tuples, already in NFT_COLUMNS order.
+    return tuple(record)
+
+async def _insert_executemany(cur, rows: list, table_name: str, chunk_size: int):
+    placeholders = ", ".join(["%s"] * len(NFT_COLUMNS))
+    query = f"INSERT INTO `{table_name}` ({', '.join(NFT_COLUMNS)}) VALUES ({placeholders}) {NFT_UPSERT}"
+    for start in range(0, len(rows), chunk_size):
+        await cur.executemany(query, rows[start:start + chunk_size])
+
+async def _insert_multirow(cur, rows: list, table_name: str, chunk_size: int):
+    row_placeholder = "(" + ", ".join(["%s"] * len(NFT_COLUMNS)) + ")"
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        query = (
+            f"INSERT INTO `{table_name}` ({', '.join(NFT_COLUMNS)}) VALUES "
+            + ", ".join([row_placeholder] * len(chunk))
+            + NFT_UPSERT
+        )
+        await cur.execute(query, [value for row in chunk for value in row])
+
+def _tsv_value(value) -> str:
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+def _write_tsv(rows: list) -> str:
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", suffix=".tsv", delete=False) as f:
+        for row in rows:
+            f.write("\t".join(_tsv_value(value) for value in row) + "\n")
+        return f.name
+
+async def _insert_load_data(cur, rows: list, table_name: str, chunk_size: int):
+    columns = ", ".join(NFT_COLUMNS)
+    await cur.execute(
+        """
+        CREATE TEMPORARY TABLE IF NOT EXISTS nft_staging (
+            name VARCHAR(64), number INTEGER, m VARCHAR(255), bd VARCHAR(255), s VARCHAR(255),
+            mchance INTEGER, bdchance INTEGER, schance INTEGER,
+            hex1 CHAR(7), hex2 CHAR(7), s_in_dir CHAR(6)
+        )
+        """
+    )
+    for start in range(0, len(rows), chunk_size):
+        path = await asyncio.to_thread(_write_tsv, rows[start:start + chunk_size])
+        try:
+            await cur.execute("TRUNCATE TABLE nft_staging")
+            await cur.execute(
+                f"LOAD DATA LOCAL INFILE %s INTO TABLE nft_staging CHARACTER SET utf8mb4 ({columns})",
+                (path,)
+            )
+            await cur.execute(
+                f"INSERT INTO `{table_name}` ({columns}) SELECT {columns} FROM nft_staging {NFT_UPSERT}"
+            )
+        finally:
+            os.remove(path)
+
+LOADERS = {
+    "executemany": _insert_executemany,
+    "multirow": _insert_multirow,
+    "load_data": _insert_load_data,
+}
+
+async def insert_nft_batch(pool: aiomysql.Pool, data_list: list, table_name: str,
+                           mode: str = None, chunk_size: int = None) -> float:
+    settings = get_settings()
+    mode = mode or settings.db_load_mode
+    chunk_size = chunk_size or settings.db_chunk_size
+    rows = [_nft_row(data) for data in data_list]
+    if not rows:
+        return 0.0
+    start = time.perf_counter()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await LOADERS[mode](cur, rows, table_name, chunk_size)
+            await conn.commit()
+    elapsed = time.perf_counter() - start
+    DB_ROWS.labels(mode).inc(len(rows))
+    DB_LATENCY.labels(mode).observe(elapsed)
+    rate = len(rows) / elapsed if elapsed else float("inf")
+    logger.debug(f"[{table_name}] {len(rows)} rows written in {elapsed:.3f}s ({rate:.0f} rows/s, {mode})")
+    return rate
+
+async def stream_rows(pool: aiomysql.Pool, query: str, args=(), fetch_size: int = None):
+    # SSCursor leaves the result set on the server and pulls it in chunks; the connection stays busy
+    # until the last chunk, so keep the consumer fast or the server drops it after net_write_timeout.
+    fetch_size = fetch_size or get_settings().db_fetch_size
+    async with pool.acquire() as conn:
+        async with conn.cursor(aiomysql.SSCursor) as cur:
+            await cur.execute(query, args)
+            while True:
+                rows = await cur.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield rows
+
+async def iter_first_numbers(pool: aiomysql.Pool, table_name: str, name: str, column: str,
+                             unresolved: bool = False, page_size: int = None):
+    # Pages of (value, first number) ordered by value; each page is a short indexed query, so
+    # slow consumers (downloads) never hold a connection between pages.
+    page_size = page_size or get_settings().db_fetch_size
+    after = None
+    while True:
+        conditions = "name = %s" + (" AND s_in_dir IS NULL" if unresolved else "")
+        args = [name]
+        if after is not None:
+            conditions += f" AND `{column}` > %s"
+            args.append(after)
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cur:
+                await cur.execute(
+                    f"""
+                    SELECT `{column}`, MIN(number) FROM `{table_name}` WHERE {conditions}
+                    GROUP BY `{column}` ORDER BY `{column}` LIMIT %s
+                    """,
+                    (*args, page_size)
+                )
+                rows = await cur.fetchall()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        after = rows[-1][0]
+
+async def apply_symbol_dirs(pool: aiomysql.Pool, table_name: str, name: str, mapping: dict) -> int:
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                """
+                CREATE TEMPORARY TABLE IF NOT EXISTS symbol_map (
+                    s VARCHAR(255) PRIMARY KEY,
+                    s_in_dir CHAR(6) NOT NULL
+                )
+                """
+            )
+            await cur.execute("TRUNCATE TABLE symbol_map")
+            await cur.executemany(
+                "INSERT INTO symbol_map (s, s_in_dir) VALUES (%s, %s)",
+                list(mapping.items())
+            )
+            await cur.execute(
+                f"""
+                UPDATE `{table_name}` t JOIN symbol_map m ON t.s = m.s
+                SET t.s_in_dir = m.s_in_dir
+                WHERE t.name = %s AND t.s_in_dir IS NULL
+                """,
+                (name,)
+            )
+            updated = cur.rowcount
+            await conn.commit()
+    return updated
+
+async def update(pool: aiomysql.Pool, table_name: str, id: int, column: str, value: Any) -> None:
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            query = f"UPDATE `{table_name}` SET `{column}` = %s WHERE id = %s"
+            await cur.execute(query, (value, id))
+            await conn.commit()
+
+async def create_dead_letter_table(pool: aiomysql.Pool):
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute(
                 f"""
-                CREATE TABLE IF NOT EXISTS `{table_name}` (
-                    id INTEGER PRIMARY KEY AUTO_INCREMENT,
-                    name TEXT NOT NULL,
+                CREATE TABLE IF NOT EXISTS `{DEAD_LETTER_TABLE}` (
+                    table_name VARCHAR(64) NOT NULL,
                     number INTEGER NOT NULL,
-                    m TEXT NOT NULL,
-                    bd TEXT NOT NULL,
-                    s TEXT NOT NULL,
-                    mchance INTEGER NOT NULL,
-                    bdchance INTEGER NOT NULL,
-                    schance INTEGER NOT NULL,
-                    hex1 CHAR(7),
-                    hex2 CHAR(7),
-                    s_in_dir CHAR(6)
+                    reason VARCHAR(255) NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 1,
+                    next_attempt_at DATETIME NOT NULL,
+                    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (table_name, number),
+                    KEY idx_next_attempt (next_attempt_at)
                 )
                 """
             )
             await conn.commit()
 
-async def insert_nft_batch(pool: aiomysql.Pool, data_list: list, table_name: str):
+async def record_dead_letters(pool: aiomysql.Pool, table_name: str, items: list):
+    settings = get_settings()
+    base_delay, max_delay = settings.dead_letter_base_delay, settings.dead_letter_max_delay
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
-            query = f"""
-                INSERT INTO `{table_name}` (
-                    name, number, m, bd, s,
-                    mchance, bdchance, schance,
-                    hex1, hex2, s_in_dir
-                ) VALUES (
-                    %s, %s, %s, %s, %s,
-                    %s, %s, %s,
-                    %s, %s, %s
-                )
-            """
             await cur.executemany(
-                query,
-                [(
-                    data["name"], data["number"], data["m"], data["bd"], data["s"],
-                    data["mchance"], data["bdchance"], data["schance"],
-                    data["hex1"], data["hex2"], data["s_in_dir"]
-                ) for data in data_list]
+                f"""
+                INSERT INTO `{DEAD_LETTER_TABLE}` (table_name, number, reason, attempts, next_attempt_at)
+                VALUES (%s, %s, %s, 1, NOW() + INTERVAL {base_delay:d} SECOND)
+                ON DUPLICATE KEY UPDATE
+                    reason = VALUES(reason),
+                    attempts = attempts + 1,
+                    next_attempt_at = NOW() + INTERVAL
+                        LEAST({base_delay:d} * POW(2, attempts), {max_delay:d}) SECOND
+                """,
+                [(table_name, number, reason) for number, reason in items]
             )
             await conn.commit()
 
-async def update(pool: aiomysql.Pool, table_name: str, id: int, column: str, value: Any) -> None:
+async def fetch_due_dead_letters(pool: aiomysql.Pool, table_name: str, limit: int) -> List[int]:
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
-            query = f"UPDATE `{table_name}` SET `{column}` = %s WHERE id = %s"
-            await cur.execute(query, (value, id))
+            await cur.execute(
+                f"""
+                SELECT number FROM `{DEAD_LETTER_TABLE}`
+                WHERE table_name = %s AND next_attempt_at <= NOW() AND attempts < %s
+                ORDER BY next_attempt_at LIMIT %s
+                """,
+                (table_name, get_settings().dead_letter_max_attempts, limit)
+            )
+            rows = await cur.fetchall()
+    return [row[0] for row in rows]
+
+async def list_dead_letter_tables(pool: aiomysql.Pool) -> List[str]:
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                SELECT DISTINCT table_name FROM `{DEAD_LETTER_TABLE}`
+                WHERE next_attempt_at <= NOW() AND attempts < %s
+                """,
+                (get_settings().dead_letter_max_attempts,)
+            )
+            rows = await cur.fetchall()
+    return [row[0] for row in rows]
+
+async def clear_dead_letters(pool: aiomysql.Pool, table_name: str, numbers: list):
+    if not numbers:
+        return
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            placeholders = ", ".join(["%s"] * len(numbers))
+            await cur.execute(
+                f"DELETE FROM `{DEAD_LETTER_TABLE}` WHERE table_name = %s AND number IN ({placeholders})",
+                (table_name, *numbers)
+            )
+            await conn.commit()
+
+async def create_page_state_table(pool: aiomysql.Pool):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS `{PAGE_STATE_TABLE}` (
+                    table_name VARCHAR(64) NOT NULL,
+                    number INTEGER NOT NULL,
+                    etag VARCHAR(255),
+                    last_modified VARCHAR(64),
+                    content_hash CHAR(32) NOT NULL,
+                    checked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                    PRIMARY KEY (table_name, number)
+                )
+                """
+            )
+            await conn.commit()
+
+async def read_page_states(pool: aiomysql.Pool, table_name: str, first: int, last: int) -> dict:
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                SELECT number, etag, last_modified, content_hash FROM `{PAGE_STATE_TABLE}`
+                WHERE table_name = %s AND number BETWEEN %s AND %s
+                """,
+                (table_name, first, last)
+            )
+            rows = await cur.fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+async def write_page_states(pool: aiomysql.Pool, table_name: str, states: list):
+    if not states:
+        return
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.executemany(
+                f"""
+                INSERT INTO `{PAGE_STATE_TABLE}` (table_name, number, etag, last_modified, content_hash)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    etag = VALUES(etag),
+                    last_modified = VALUES(last_modified),
+                    content_hash = VALUES(content_hash)
+                """,
+                [(table_name, *state) for state in states]
+            )
             await conn.commit()
+
+async def read_nft_rows(pool: aiomysql.Pool, table_name: str, name: str, first: int, last: int) -> dict:
+    columns = ", ".join(f"`{column}`" for column in NFT_TRAIT_COLUMNS)
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"SELECT number, {columns} FROM `{table_name}` WHERE name = %s AND number BETWEEN %s AND %s",
+                (name, first, last)
+            )
+            rows = await cur.fetchall()
+    return {row[0]: tuple(row[1:]) for row in rows}
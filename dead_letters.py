@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from functools import partial
+
+from database import (
+    clear_dead_letters,
+    fetch_due_dead_letters,
+    insert_nft_batch,
+    list_dead_letter_tables,
+    record_dead_letters,
+)
+from pipeline import run_pipeline
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+def describe(error) -> str:
+    if error is None:
+        return "Empty page"
+    return f"{type(error).__name__}: {error}"[:255]
+
+class DeadLetterQueue:
+    def __init__(self, pool, table_name: str):
+        self.pool = pool
+        self.table_name = table_name
+        self._pending = {}
+
+    @property
+    def pending(self) -> list:
+        # Numbers whose dead-letter write failed; they are neither stored nor queued for a retry.
+        return sorted(self._pending)
+
+    def add(self, number: int, error=None):
+        self._pending[number] = describe(error)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        items, self._pending = list(self._pending.items()), {}
+        try:
+            await record_dead_letters(self.pool, self.table_name, items)
+            logger.warning(f"[{self.table_name}] {len(items)} numbers moved to dead letters")
+        except Exception as e:
+            logger.error(f"[{self.table_name}] Dead letter write error: {e}")
+            for number, reason in items:
+                self._pending.setdefault(number, reason)
+
+async def retry_dead_letters(pool, table_name: str, fetch, flush_size: int, on_written=None) -> int:
+    settings = get_settings()
+    due = await fetch_due_dead_letters(pool, table_name, settings.retry_batch)
+    if not due:
+        return 0
+    logger.info(f"[{table_name}] Retrying {len(due)} dead letters")
+    dlq = DeadLetterQueue(pool, table_name)
+
+    async def write_batch(valid):
+        numbers = [r.number for r in valid]
+        try:
+            await insert_nft_batch(pool, valid, table_name)
+        except Exception as e:
+            for number in numbers:
+                dlq.add(number, e)
+            raise
+        await clear_dead_letters(pool, table_name, numbers)
+        if on_written:
+            on_written(valid)
+
+    stats = await run_pipeline(
+        due,
+        fetch,
+        write_batch,
+        workers=min(settings.retry_workers, len(due)),
+        flush_size=flush_size,
+        on_failed=dlq.add,
+    )
+    await dlq.flush()
+    logger.info(f"[{table_name}] Dead letters recovered: {stats['written']}, still failing: {stats['failed']}")
+    return stats['written']
+
+async def retry_scheduler(pool, fetch_for_table, flush_size: int, interval: int = None, on_written=None):
+    interval = interval or get_settings().retry_interval
+    while True:
+        try:
+            for table_name in await list_dead_letter_tables(pool):
+                fetch = fetch_for_table(table_name)
+                if fetch is not None:
+                    await retry_dead_letters(pool, table_name, fetch, flush_size,
+                                             partial(on_written, table_name) if on_written else None)
+        except Exception as e:
+            logger.error(f"Dead letter retry error: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,187 @@
+import asyncio
+import csv
+import gzip
+import io
+import logging
+from pathlib import Path
+
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+FIELDNAMES = ['name', 'number', 'm', 'bd', 's', 'mchance', 'bdchance', 'schance', 'hex1', 'hex2', 's_in_dir']
+INT_FIELDS = {'number', 'mchance', 'bdchance', 'schance'}
+
+SUFFIXES = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "csv.zst": ".csv.zst",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+
+def export_path(storage_root, table_name: str, fmt: str) -> Path:
+    if fmt not in SUFFIXES:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of: {', '.join(SUFFIXES)}")
+    return Path(storage_root) / f"{table_name}_data{SUFFIXES[fmt]}"
+
+def _next_part(path: Path) -> Path:
+    # Parquet and Arrow files cannot be appended to, so a resumed run writes the next part next to them.
+    if not path.exists():
+        return path
+    suffix = SUFFIXES["parquet"] if path.name.endswith(".parquet") else SUFFIXES["arrow"]
+    stem = path.name[:-len(suffix)]
+    part = 1
+    while (path.with_name(f"{stem}.part{part}{suffix}")).exists():
+        part += 1
+    return path.with_name(f"{stem}.part{part}{suffix}")
+
+class _CsvWriter:
+    # Every write ends in a complete gzip member or zstd frame, so the file is readable up to the last
+    # write even if the process dies, and a resumed run can cut a torn tail off and append after it.
+    durable = True
+
+    def __init__(self, path: Path, fmt: str, append: bool, size: int = None, level: int = None):
+        self.fmt = fmt
+        if fmt == "csv.gz":
+            self.level = level or 6
+        elif fmt == "csv.zst":
+            try:
+                import zstandard
+            except ImportError:
+                raise RuntimeError("EXPORT_FORMAT=csv.zst requires the zstandard package")
+            self.compressor = zstandard.ZstdCompressor(level=level or 3)
+        self.file = open(path, "ab" if append else "wb")
+        if append and size is not None and size < self.file.tell():
+            self.file.truncate(size)
+            self.file.seek(size)
+        self.text = io.StringIO()
+        self.writer = csv.writer(self.text)
+        if not self.file.tell():
+            self.writer.writerow(FIELDNAMES)
+
+    def _write_chunk(self) -> int:
+        data = self.text.getvalue().encode("utf-8")
+        self.text.seek(0)
+        self.text.truncate()
+        if self.fmt == "csv.gz":
+            data = gzip.compress(data, compresslevel=self.level)
+        elif self.fmt == "csv.zst":
+            data = self.compressor.compress(data)
+        start = self.file.tell()
+        try:
+            self.file.write(data)
+            self.file.flush()
+        except Exception:
+            self.file.truncate(start)
+            self.file.seek(start)
+            raise
+        return self.file.tell()
+
+    def write(self, rows: list) -> int:
+        self.writer.writerows(rows)
+        return self._write_chunk()
+
+    def close(self) -> int:
+        try:
+            return self._write_chunk() if self.text.tell() else self.file.tell()
+        finally:
+            self.file.close()
+
+class _ArrowWriter:
+    # Parquet and Arrow files have no footer until they are closed, so only close() makes rows durable.
+    durable = False
+
+    def __init__(self, path: Path, fmt: str, append: bool, size: int = None, level: int = None):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise RuntimeError(f"EXPORT_FORMAT={fmt} requires the pyarrow package")
+        self.pa = pa
+        self.schema = pa.schema([
+            (field, pa.int32() if field in INT_FIELDS else pa.string())
+            for field in FIELDNAMES
+        ])
+        path = _next_part(path) if append else path
+        if fmt == "parquet":
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression="zstd")
+            self.writer = pa.ipc.new_file(str(path), self.schema, options=options)
+        self.path = path
+
+    def write(self, rows: list):
+        batch = self.pa.RecordBatch.from_arrays(
+            [self.pa.array(column, type=self.schema.field(i).type) for i, column in enumerate(zip(*rows))],
+            schema=self.schema,
+        )
+        self.writer.write_batch(batch)
+
+    def close(self) -> int:
+        self.writer.close()
+        return self.path.stat().st_size
+
+class ExportSink:
+    def __init__(self, path, fmt: str = None, buffer_rows: int = None, append: bool = False,
+                 size: int = None, on_commit=None):
+        settings = get_settings()
+        fmt = fmt or settings.export_format
+        if fmt not in SUFFIXES:
+            raise ValueError(f"Unknown export format {fmt!r}, expected one of: {', '.join(SUFFIXES)}")
+        self.path = Path(path)
+        self.fmt = fmt
+        self.buffer_rows = buffer_rows or settings.export_buffer_rows
+        self.compression_level = settings.export_compression_level
+        self.append = append
+        # `size` is the length the file had at the last commit; an append run truncates anything after it.
+        self.size = size
+        # Called with the file size once the rows written so far are on disk.
+        self.on_commit = on_commit
+        self.rows = []
+        self.written = 0
+        self._writer = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def open(self):
+        writer_cls = _CsvWriter if self.fmt.startswith("csv") else _ArrowWriter
+        self._writer = await asyncio.to_thread(writer_cls, self.path, self.fmt, self.append, self.size,
+                                             self.compression_level)
+        self.path = getattr(self._writer, "path", self.path)
+
+    async def write(self, rows: list):
+        # NftRecord tuples are already in FIELDNAMES order, so they are buffered as they are.
+        self.rows.extend(rows)
+        if len(self.rows) >= self.buffer_rows:
+            await self.flush()
+
+    async def flush(self):
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        size = await asyncio.to_thread(self._writer.write, rows)
+        self.written += len(rows)
+        if self._writer.durable:
+            self._commit(size)
+
+    def _commit(self, size: int):
+        self.size = size
+        if self.on_commit:
+            self.on_commit(size)
+
+    async def close(self):
+        if self._writer is None:
+            return
+        try:
+            await self.flush()
+        finally:
+            writer, self._writer = self._writer, None
+            size = await asyncio.to_thread(writer.close)
+        self._commit(size)
+        logger.info(f"Exported {self.written} rows to `{self.path}`")
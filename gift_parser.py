@@ -0,0 +1,124 @@
+from typing import NamedTuple, Optional, Union
+
+from lxml import etree, html
+
+_ROWS = etree.XPath('//table[contains(@class,"tgme_gift_table")]//tr')
+# Plain strings: lxml's default "smart" strings keep a reference to the whole parsed document.
+_STOPS = etree.XPath('//radialgradient[@id="giftGradient"]//stop/@stop-color', smart_strings=False)
+_TGS = etree.XPath('//source[@type="application/x-tgsticker"]/@srcset', smart_strings=False)
+_PATTERN = etree.XPath('//image[@id="giftPattern"]')
+
+_TRAITS = ("model", "backdrop", "symbol")
+
+class GiftPage(NamedTuple):
+    model: str = "Unknown"
+    model_chance: int = 0
+    backdrop: str = "Unknown"
+    backdrop_chance: int = 0
+    symbol: str = "Unknown"
+    symbol_chance: int = 0
+    hex1: str = "None"
+    hex2: str = "None"
+    quantity: Optional[int] = None
+    tgs_url: Optional[str] = None
+    pattern_url: Optional[str] = None
+
+class NftRecord(NamedTuple):
+    # A plain tuple in NFT_COLUMNS / FIELDNAMES order, so the DB loaders and the export take it as is.
+    name: str
+    number: int
+    m: str
+    bd: str
+    s: str
+    mchance: int
+    bdchance: int
+    schance: int
+    hex1: str
+    hex2: str
+    s_in_dir: Optional[str] = None
+
+def _parse_chance(text: str) -> int:
+    chance = text.replace("%", "").strip()
+    try:
+        return int(float(chance) * 100) if chance else 0
+    except ValueError:
+        return 0
+
+def _parse_trait(td) -> tuple:
+    full = td.text_content()
+    mark = td.find("mark")
+    if mark is None:
+        return full.strip(), 0
+    chance = mark.text_content()
+    return full.replace(chance, "", 1).strip(), _parse_chance(chance)
+
+def _parse_quantity(td) -> Optional[int]:
+    if not td.text:
+        return None
+    try:
+        return int(td.text.split('/')[0].replace('\u00A0', '').replace(' ', '').replace(',', ''))
+    except ValueError:
+        return None
+
+def parse_gift_page(content: Union[str, bytes]) -> GiftPage:
+    tree = html.fromstring(content)
+    values = {}
+
+    for tr in _ROWS(tree):
+        th = tr.find("th")
+        td = tr.find("td")
+        if th is None or td is None:
+            continue
+        key = th.text_content().strip().lower()
+        for trait in _TRAITS:
+            if trait in key:
+                values[trait], values[f"{trait}_chance"] = _parse_trait(td)
+                break
+        else:
+            if "quantity" in key:
+                values["quantity"] = _parse_quantity(td)
+
+    stops = _STOPS(tree)
+    if stops:
+        values["hex1"] = stops[0]
+        if len(stops) > 1:
+            values["hex2"] = stops[1]
+
+    tgs = _TGS(tree)
+    if tgs:
+        values["tgs_url"] = tgs[0]
+
+    pattern = _PATTERN(tree)
+    if pattern:
+        values["pattern_url"] = pattern[0].get("xlink:href")
+
+    return GiftPage(**values)
+
+def record_from_page(name: str, number: int, page: GiftPage) -> NftRecord:
+    return NftRecord(
+        name,
+        number,
+        page.model,
+        page.backdrop,
+        page.symbol,
+        page.model_chance,
+        page.backdrop_chance,
+        page.symbol_chance,
+        page.hex1,
+        page.hex2,
+    )
+
+def build_record(name: str, number: int, content: Union[str, bytes]) -> NftRecord:
+    return record_from_page(name, number, parse_gift_page(content))
+
+def parse_batch(name: str, pages: list) -> list:
+    # (number, record, error, (tgs_url, pattern_url)): the asset URLs go back with the record,
+    # so the asset stages need not fetch the page again.
+    results = []
+    for number, content in pages:
+        try:
+            page = parse_gift_page(content)
+            results.append((number, record_from_page(name, number, page), None, (page.tgs_url, page.pattern_url)))
+        except Exception as e:
+            results.append((number, None, RuntimeError(f"{type(e).__name__}: {e}"), None))
+    return results
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import random
+import ssl
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import NamedTuple, Optional
+
+import aiohttp
+import certifi
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+
+from rate_limiter import AdaptiveRateLimiter, parse_retry_after
+from metrics import HTTP_BYTES, HTTP_CACHE_HITS, HTTP_ERRORS, HTTP_LATENCY, HTTP_REQUESTS, HTTP_RETRIES, RATE_LIMIT
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+_limiter = None
+
+def get_limiter() -> AdaptiveRateLimiter:
+    # One limiter per process, shared by every Fetcher, so parallel collections split a single request rate.
+    global _limiter
+    if _limiter is None:
+        settings = get_settings()
+        _limiter = AdaptiveRateLimiter(
+            rate=settings.rate,
+            min_rate=settings.min_rate,
+            max_rate=settings.max_rate,
+            increase=settings.rate_increase,
+            decrease=settings.rate_decrease,
+            latency_target=settings.latency_target,
+        )
+        RATE_LIMIT.set_function(lambda: _limiter.rate)
+    return _limiter
+
+class FetchStatusError(Exception):
+    def __init__(self, url: str, status: int):
+        super().__init__(f"Status {status} for {url}")
+        self.url = url
+        self.status = status
+
+class RetryableStatusError(FetchStatusError):
+    pass
+
+class PageResponse(NamedTuple):
+    status: int
+    body: Optional[bytes]
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+def _trace_config() -> aiohttp.TraceConfig:
+    # Only sampled requests carry a trace context; the callbacks return early for the rest.
+    def mark(event):
+        async def callback(session, ctx, params):
+            trace = ctx.trace_request_ctx
+            if trace is not None:
+                setattr(trace, event, time.monotonic())
+        return callback
+
+    async def reused(session, ctx, params):
+        if ctx.trace_request_ctx is not None:
+            ctx.trace_request_ctx.reused = True
+
+    config = aiohttp.TraceConfig()
+    config.on_request_start.append(mark("start"))
+    config.on_dns_resolvehost_end.append(mark("dns"))
+    config.on_connection_create_end.append(mark("connected"))
+    config.on_connection_reuseconn.append(reused)
+    config.on_request_end.append(mark("headers"))
+    return config
+
+def _log_trace(url: str, status, trace: SimpleNamespace):
+    done = time.monotonic()
+    start = getattr(trace, "start", done)
+    steps = []
+    previous = start
+    for event in ("dns", "connected", "headers"):
+        at = getattr(trace, event, None)
+        if at is not None:
+            steps.append(f"{event} +{at - previous:.3f}s")
+            previous = at
+    steps.append(f"body +{done - previous:.3f}s")
+    connection = "reused connection" if getattr(trace, "reused", False) else "new connection"
+    logger.warning(f"Slow request {url} ({status}): {done - start:.3f}s, {connection}, {', '.join(steps)}")
+
+def create_session() -> aiohttp.ClientSession:
+    settings = get_settings()
+    ssl_context = ssl.create_default_context(cafile=certifi.where())
+    connector = aiohttp.TCPConnector(
+        ssl=ssl_context,
+        limit=settings.http_limit,
+        limit_per_host=settings.http_limit_per_host,
+        use_dns_cache=True,
+        ttl_dns_cache=settings.dns_cache_ttl,
+        keepalive_timeout=settings.keepalive_timeout,
+    )
+    trace_configs = [_trace_config()] if settings.trace_sample_rate else None
+    return aiohttp.ClientSession(headers={"User-Agent": settings.user_agent}, connector=connector,
+                                 timeout=REQUEST_TIMEOUT, trace_configs=trace_configs)
+
+class Fetcher:
+    def __init__(self, session: aiohttp.ClientSession, cache_size: int = None, limiter: AdaptiveRateLimiter = None):
+        settings = get_settings()
+        self.session = session
+        self.cache_size = settings.cache_size if cache_size is None else cache_size
+        self.limiter = limiter or get_limiter()
+        self.trace_sample_rate = settings.trace_sample_rate
+        self.trace_slow_seconds = settings.trace_slow_seconds
+        self._cache = OrderedDict()
+        self._inflight = {}
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=2, max=10),
+        retry=retry_if_exception_type((aiohttp.ClientError, ConnectionResetError, RetryableStatusError)),
+        before_sleep=lambda retry_state: HTTP_RETRIES.inc(),
+        reraise=True,
+    )
+    async def _request(self, url: str, headers: dict = None) -> PageResponse:
+        limiter = self.limiter
+        await limiter.acquire()
+        trace = SimpleNamespace() if self.trace_sample_rate and random.random() < self.trace_sample_rate else None
+        started = time.monotonic()
+        try:
+            async with self.session.get(url, headers=headers, trace_request_ctx=trace) as resp:
+                if resp.status == 304 and headers:
+                    data = None
+                elif resp.status != 200:
+                    latency = time.monotonic() - started
+                    HTTP_REQUESTS.labels(resp.status).inc()
+                    HTTP_LATENCY.observe(latency)
+                    limiter.record(resp.status, latency, parse_retry_after(resp.headers.get("Retry-After")))
+                    if resp.status == 429 or resp.status >= 500:
+                        raise RetryableStatusError(url, resp.status)
+                    raise FetchStatusError(url, resp.status)
+                else:
+                    data = await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionResetError):
+            HTTP_ERRORS.inc()
+            limiter.record_error()
+            raise
+        latency = time.monotonic() - started
+        HTTP_REQUESTS.labels(resp.status).inc()
+        HTTP_LATENCY.observe(latency)
+        if data is not None:
+            HTTP_BYTES.inc(len(data))
+        limiter.record(resp.status, latency)
+        if trace is not None and latency >= self.trace_slow_seconds:
+            _log_trace(url, resp.status, trace)
+        return PageResponse(resp.status, data, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+
+    async def _download(self, url: str) -> bytes:
+        return (await self._request(url)).body
+
+    async def get_conditional(self, url: str, etag: str = None, last_modified: str = None) -> PageResponse:
+        # Bypasses the cache: a 304 has no body, and a refresh wants the server's current answer.
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return await self._request(url, headers or None)
+
+    def _remember(self, url: str, data: bytes):
+        self._cache[url] = data
+        self._cache.move_to_end(url)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def get_bytes(self, url: str, cache: bool = True) -> bytes:
+        if not cache:
+            return await self._download(url)
+        if url in self._cache:
+            self._cache.move_to_end(url)
+            HTTP_CACHE_HITS.inc()
+            return self._cache[url]
+        if url in self._inflight:
+            return await asyncio.shield(self._inflight[url])
+
+        task = asyncio.ensure_future(self._download(url))
+        self._inflight[url] = task
+        try:
+            data = await asyncio.shield(task)
+            self._remember(url, data)
+            return data
+        finally:
+            self._inflight.pop(url, None)
@@ -1,338 +1,362 @@
 import asyncio
-import aiohttp
-import aiomysql
-import aiofiles
-import json
-import random
-import string
 import time
 import logging
-import ssl
-import certifi
-import csv
+import argparse
+import hashlib
 from pathlib import Path
-from bs4 import BeautifulSoup
-from lxml import html
-from asyncio_throttle import Throttler
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from nft_utils import (
-    get_first_frame_from_tgs_page,
-    download_and_save_tgs_as_json,
-    download_transparent_png_from_svg,
-    download_tgs_file,
-    get_current_quantity
+from gift_parser import parse_batch, parse_gift_page, record_from_page
+from functools import partial
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from nft_utils import save_model_assets, fetch_pattern_png
+from renderer import is_up_to_date, model_outputs, render_saved_model
+from database import (
+    NFT_TRAIT_COLUMNS,
+    create_pool,
+    create_table,
+    create_dead_letter_table,
+    create_page_state_table,
+    insert_nft_batch,
+    clear_dead_letters,
+    iter_first_numbers,
+    apply_symbol_dirs,
+    read_page_states,
+    write_page_states,
+    read_nft_rows,
 )
-from database import create_pool, create_table, insert_nft_batch, update
-from dotenv import load_dotenv
-import os
+from pipeline import SKIPPED, run_pipeline
+from migrations import sync_trait_summary
+from symbol_registry import open_registry
+from pattern_store import PatternStore
+from checkpoint import Checkpoint
+from export import ExportSink
+from dead_letters import DeadLetterQueue, retry_dead_letters
+from http_client import Fetcher, create_session
+from metrics import PARSE_LATENCY, REFRESH_PAGES, RENDERS, RENDER_LATENCY, SYMBOLS, SYMBOL_LATENCY, report_metrics
+from collection import Collection
+from scraper import get_current_quantity, fetch_page, parse_page
+from settings import get_settings
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
-NFT_NAME = os.getenv("NFT_NAME")
-BASE_URL = os.getenv("BASE_URL").format(NFT_NAME_LOWER=NFT_NAME.lower())
-TABLE_NAME = os.getenv("TABLE_NAME").format(NFT_NAME_LOWER=NFT_NAME.lower())
-STORAGE_ROOT = Path(os.getenv("STORAGE_ROOT"))
-MODELS_ROOT = STORAGE_ROOT / "models" / NFT_NAME
-IMG_DIR = MODELS_ROOT / "img"
-ANIM_DIR = MODELS_ROOT / "anim"
-TGS_DIR = MODELS_ROOT / "tgs"
-SYMBOLS_PATH = STORAGE_ROOT / "patterns" / "symbols.json"
-PATTERNS_DIR = STORAGE_ROOT / "patterns"
-CSV_PATH = STORAGE_ROOT / f"{TABLE_NAME}_data.csv"
-HEADERS = {"User-Agent": os.getenv("HEADERS").split(": ")[1]}
-throttler = Throttler(rate_limit=int(os.getenv("RATE_LIMIT")), period=int(os.getenv("PERIOD")))
-BATCH_SIZE = int(os.getenv("BATCH_SIZE"))
-
-def prepare_dirs_and_index():
-    IMG_DIR.mkdir(parents=True, exist_ok=True)
-    ANIM_DIR.mkdir(parents=True, exist_ok=True)
-    TGS_DIR.mkdir(parents=True, exist_ok=True)
-    PATTERNS_DIR.mkdir(parents=True, exist_ok=True)
-
-async def get_current_quantity(session):
-    async with throttler, session.get(BASE_URL + "1") as resp:
-        resp.raise_for_status()
-        text = await resp.text()
-    tree = html.fromstring(text)
-    qty = tree.xpath(
-        '//table[contains(@class,"tgme_gift_table")]'
-        '//tr[th[contains(translate(., "Q","q"), "quantity")]]/td/text()'
-    )
-    if not qty:
-        logger.error("Quantity field not found")
-        raise RuntimeError("Quantity field not found")
-    return int(qty[0].split('/')[0].replace('\u00A0', '').replace(',', ''))
-
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=2, max=10),
-    retry=retry_if_exception_type((aiohttp.ClientError, ConnectionResetError))
-)
-async def parse_page(session, idx):
-    url = BASE_URL + str(idx)
+async def save_all_to_db(pool, fetcher, collection: Collection, resume: bool = False,
+                         workers: int = None):
+    settings = get_settings()
+    workers = workers or settings.workers
+    table_name, checkpoint_path = collection.table_name, collection.checkpoint_path
+    total = await get_current_quantity(fetcher, collection)
+    logger.info(f"[{table_name}] Total models: {total}. Saving to `{table_name}` and `{collection.export_path}`")
+
+    if resume:
+        checkpoint = Checkpoint.load(checkpoint_path)
+        logger.info(f"[{table_name}] Resuming from `{checkpoint_path}`: {len(checkpoint.done)} done ranges, {len(checkpoint.failed)} failed ranges")
+    else:
+        checkpoint = Checkpoint(checkpoint_path)
+
+    # Numbers written to the DB whose export rows are still buffered; they are marked done only once the
+    # sink has them on disk, so a crash cannot checkpoint rows the export never got.
+    exported = []
+
+    def commit(export_size=None):
+        checkpoint.mark_done(exported)
+        exported.clear()
+        if export_size is not None:
+            checkpoint.export_size = export_size
+        checkpoint.save()
+
+    export = ExportSink(collection.export_path, collection.export_format, append=resume,
+                        size=checkpoint.export_size if resume else None, on_commit=commit)
     try:
-        async with throttler, session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-            if resp.status != 200:
-                logger.warning(f"[{idx}] Status {resp.status} for {url}")
-                return idx, None
-            text = await resp.text()
+        await export.open()
     except Exception as e:
-        logger.error(f"[{idx}] Request error for {url}: {e}")
+        logger.error(f"Export creation error `{collection.export_path}`: {e}")
         raise
-    tree = html.fromstring(text)
-    d = {
-        "name": NFT_NAME.lower(),
-        "number": idx,
-        "m": "Unknown",
-        "bd": "Unknown",
-        "s": "Unknown",
-        "mchance": 0,
-        "bdchance": 0,
-        "schance": 0,
-        "hex1": "None",
-        "hex2": "None",
-        "s_in_dir": None
-    }
-
-    for key, db_key in [("model", "m"), ("backdrop", "bd"), ("symbol", "s")]:
-        tr = tree.xpath(
-            f'//table[contains(@class,"tgme_gift_table")]'
-            f'//tr[th[contains(translate(., "{key.upper()}","{key.lower()}"), "{key}")]]'
-        )
-        if tr:
-            td = tr[0].find("td")
-            mark = td.find("mark")
-            chance = mark.text_content().replace("%", "").strip() if mark is not None else "0"
-            full = td.text_content().strip()
-            name = full.replace(mark.text_content(), "").strip() if mark is not None else full
-            try:
-                chance_value = float(chance) * 100 if chance else 0
-                d[db_key], d[f"{db_key}chance"] = name, int(chance_value)
-            except ValueError:
-                logger.warning(f"[{idx}] Invalid chance format for {key}: {chance}")
-                d[db_key], d[f"{db_key}chance"] = name, 0
-        else:
-            d[db_key], d[f"{db_key}chance"] = "Unknown", 0
 
-    stops = tree.xpath('//radialgradient[@id="giftGradient"]//stop/@stop-color')
-    d["hex1"], d["hex2"] = (stops + ["None", "None"])[:2]
+    dlq = DeadLetterQueue(pool, table_name)
 
-    logger.info(f"Parsed NFT ID: {idx}, Model: {d['m']} ({d['mchance']/100:.1f}%), Backdrop: {d['bd']} ({d['bdchance']/100:.1f}%), Symbol: {d['s']} ({d['schance']/100:.1f}%), Gradient: {d['hex1']}, {d['hex2']}")
+    def on_failed(idx, error):
+        checkpoint.mark_failed([idx])
+        dlq.add(idx, error)
 
-    return idx, d
-
-async def save_all_to_db(pool):
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        total = await get_current_quantity(session)
-        logger.info(f"Total models: {total}. Saving to `{TABLE_NAME}` and `{CSV_PATH}`")
-
-        fieldnames = ['name', 'number', 'm', 'bd', 's', 'mchance', 'bdchance', 'schance', 'hex1', 'hex2', 's_in_dir']
+    async def write_batch(valid):
+        numbers = [r.number for r in valid]
         try:
-            async with aiofiles.open(CSV_PATH, mode='w', encoding='utf-8', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                await writer.writeheader()
+            await insert_nft_batch(pool, valid, table_name)
+            await clear_dead_letters(pool, table_name, numbers)
         except Exception as e:
-            logger.error(f"CSV creation error `{CSV_PATH}`: {e}")
-            raise
-
-        for start in range(1, total + 1, BATCH_SIZE):
-            end = min(start + BATCH_SIZE, total + 1)
-            logger.info(f"Processing batch {start}–{end - 1}")
-            batch_start_time = time.time()
-
-            tasks = [parse_page(session, idx) for idx in range(start, end)]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            valid = [r[1] for r in results if not isinstance(r, Exception) and r[1] is not None]
-            if valid:
-                try:
-                    await insert_nft_batch(pool, valid, TABLE_NAME)
-                except Exception as e:
-                    logger.error(f"Batch {start}–{end - 1} DB write error: {e}")
-
-                try:
-                    async with aiofiles.open(CSV_PATH, mode='a', encoding='utf-8', newline='') as f:
-                        writer = csv.DictWriter(f, fieldnames=fieldnames)
-                        await writer.writerows(valid)
-                except Exception as e:
-                    logger.error(f"Batch {start}–{end - 1} CSV write error: {e}")
+            logger.error(f"[{table_name}] Batch {numbers[0]}–{numbers[-1]} DB write error: {e}")
+            checkpoint.mark_failed(numbers)
+            for number in numbers:
+                dlq.add(number, e)
+            await dlq.flush()
+            return
 
-            batch_time = time.time() - batch_start_time
-            logger.info(f"Batch {start}–{end - 1} done in {batch_time:.2f}s")
-            await asyncio.sleep(0.1)
+        exported.extend(numbers)
+        try:
+            await export.write(valid)
+        except Exception as e:
+            logger.error(f"[{table_name}] Batch {numbers[0]}–{numbers[-1]} export write error: {e}")
+            # The rows are in the DB, so they still count as done; only this chunk of the export is lost.
+            commit()
+        await dlq.flush()
 
-        logger.info(f"Data saved to `{TABLE_NAME}` and `{CSV_PATH}`")
+    try:
+        with ProcessPoolExecutor(max_workers=settings.parse_workers) if settings.parse_workers else nullcontext() as executor:
+            stats = await run_pipeline(
+                checkpoint.missing(total),
+                partial(fetch_page, fetcher, collection) if executor else partial(parse_page, fetcher, collection),
+                write_batch,
+                workers=workers,
+                flush_size=settings.batch_size,
+                flush_interval=settings.flush_interval,
+                on_failed=on_failed,
+                parse_batch=partial(parse_batch, collection.name) if executor else None,
+                executor=executor,
+                parse_workers=settings.parse_workers,
+                parse_chunk=settings.parse_chunk,
+                on_parsed=collection.remember_assets,
+            )
+    finally:
+        try:
+            await export.close()
+        except Exception as e:
+            logger.error(f"Export close error `{export.path}`: {e}")
+            commit()
+    checkpoint.save()
+    await dlq.flush()
+    await retry_dead_letters(pool, table_name, partial(parse_page, fetcher, collection), settings.batch_size)
+    logger.info(f"[{table_name}] Written: {stats['written']}, failed: {stats['failed']}")
+    logger.info(f"Data saved to `{table_name}` and `{export.path}`")
+    return stats
+
+def content_hash(body: bytes) -> str:
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+async def refresh_page(fetcher, collection: Collection, states: dict, rows: dict,
+                       unchanged_states: list, changed_states: dict, idx):
+    etag, last_modified, old_hash = states.get(idx, (None, None, None))
+    response = await fetcher.get_conditional(collection.page_url(idx), etag, last_modified)
+    if response.status == 304:
+        REFRESH_PAGES.labels("not_modified").inc()
+        return idx, SKIPPED
+
+    state = (idx, response.etag, response.last_modified, content_hash(response.body))
+    if state[3] == old_hash:
+        if (response.etag, response.last_modified) != (etag, last_modified):
+            unchanged_states.append(state)
+        REFRESH_PAGES.labels("same_content").inc()
+        return idx, SKIPPED
+
+    started = time.perf_counter()
+    page = parse_gift_page(response.body)
+    d = record_from_page(collection.name, idx, page)
+    PARSE_LATENCY.observe(time.perf_counter() - started)
+    collection.remember_assets(d, page.tgs_url, page.pattern_url)
+    if tuple(getattr(d, column) for column in NFT_TRAIT_COLUMNS) == rows.get(idx):
+        # The page changed (owner, markup) but none of the stored fields did.
+        unchanged_states.append(state)
+        REFRESH_PAGES.labels("same_record").inc()
+        return idx, SKIPPED
+
+    # Saved only once the row is written, so a failed write is retried on the next refresh.
+    changed_states[idx] = state
+    REFRESH_PAGES.labels("changed").inc()
+    logger.debug(f"[{collection.table_name}] {idx} changed: {rows.get(idx)} -> {d}")
+    return idx, d
 
-async def read_unique_models(pool):
-    unique = {}
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
+async def refresh_all(pool, fetcher, collection: Collection, workers: int = None):
+    settings = get_settings()
+    workers = workers or settings.workers
+    table_name = collection.table_name
+    total = await get_current_quantity(fetcher, collection)
+    logger.info(f"[{table_name}] Refreshing {total} pages")
+    dlq = DeadLetterQueue(pool, table_name)
+    totals = {"failed": 0, "written": 0, "skipped": 0}
+
+    for first in range(1, total + 1, settings.refresh_block):
+        last = min(first + settings.refresh_block - 1, total)
+        states = await read_page_states(pool, table_name, first, last)
+        rows = await read_nft_rows(pool, table_name, collection.name, first, last)
+        unchanged_states = []
+        changed_states = {}
+
+        async def write_batch(valid):
+            numbers = [r.number for r in valid]
+            written = [changed_states.pop(number) for number in numbers]
             try:
-                await cur.execute(
-                    f"SELECT number, m FROM `{TABLE_NAME}` WHERE name = %s",
-                    (NFT_NAME.lower(),)
-                )
-                rows = await cur.fetchall()
-                for number, model_name in rows:
-                    if model_name not in unique:
-                        unique[model_name] = number
+                await insert_nft_batch(pool, valid, table_name)
+                await clear_dead_letters(pool, table_name, numbers)
+                await write_page_states(pool, table_name, written)
             except Exception as e:
-                logger.error(f"Error reading models from `{TABLE_NAME}`: {e}")
+                logger.error(f"[{table_name}] Batch {numbers[0]}–{numbers[-1]} DB write error: {e}")
+                for number in numbers:
+                    dlq.add(number, e)
+                await dlq.flush()
                 raise
-    return unique
-
-async def download_model(name, idx, session):
-    url = BASE_URL + str(idx)
-    try:
-        img = await asyncio.to_thread(get_first_frame_from_tgs_page, url)
-        img.save(IMG_DIR / f"{name}.png")
-        logger.info(f"Model {name}.png saved")
-    except Exception as e:
-        logger.error(f"Model preview error for {name}: {e}")
 
+        stats = await run_pipeline(
+            range(first, last + 1),
+            partial(refresh_page, fetcher, collection, states, rows, unchanged_states, changed_states),
+            write_batch,
+            workers=workers,
+            flush_size=settings.batch_size,
+            flush_interval=settings.flush_interval,
+            on_failed=dlq.add,
+        )
+        try:
+            await write_page_states(pool, table_name, unchanged_states)
+        except Exception as e:
+            logger.error(f"[{table_name}] Page state write error: {e}")
+        await dlq.flush()
+        for key in totals:
+            totals[key] += stats[key]
+        logger.info(f"[{table_name}] Refreshed {first}–{last}: {stats['written']} changed, {stats['skipped']} unchanged, {stats['failed']} failed")
+
+    logger.info(f"[{table_name}] Refresh done: {totals['written']} changed, {totals['skipped']} unchanged, {totals['failed']} failed")
+
+async def download_model(collection: Collection, name, idx, fetcher, executor):
+    outputs = model_outputs(collection, name)
+    if is_up_to_date(outputs.tgs, outputs.rendered()):
+        RENDERS.labels("skipped").inc()
+        logger.debug(f"Model {name} is up to date")
+        return
+    started = time.perf_counter()
     try:
-        await asyncio.to_thread(download_and_save_tgs_as_json, url, ANIM_DIR / f"{name}.json")
-        logger.info(f"Model {name}.json saved")
+        if outputs.tgs.exists():
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(executor, render_saved_model, outputs)
+            RENDERS.labels("rendered").inc()
+            logger.info(f"Model {name} rendered from the saved tgs")
+        else:
+            await save_model_assets(
+                fetcher, collection.page_url(idx), outputs.png, outputs.json, outputs.tgs, executor, outputs.previews,
+                collection.model_urls.get(name),
+            )
+            RENDERS.labels("saved").inc()
+            logger.info(f"Model {name} saved (png, json, tgs)")
     except Exception as e:
-        logger.error(f"Model JSON animation error for {name}: {e}")
+        RENDERS.labels("error").inc()
+        logger.error(f"Model asset error for {name}: {e}")
+    RENDER_LATENCY.observe(time.perf_counter() - started)
+
+async def download_models(pool, fetcher, collection: Collection, executor=None):
+    table_name = collection.table_name
+    logger.info(f"[{table_name}] Downloading models")
+    settings = get_settings()
+    semaphore = asyncio.Semaphore(settings.model_concurrency)
+    count = 0
+
+    async def bounded(name, idx):
+        async with semaphore:
+            await download_model(collection, name, idx, fetcher, executor)
+
+    with nullcontext(executor) if executor else ProcessPoolExecutor(max_workers=settings.render_workers) as executor:
+        try:
+            async for models in iter_first_numbers(pool, table_name, collection.name, "m"):
+                count += len(models)
+                await asyncio.gather(*(bounded(name, idx) for name, idx in models), return_exceptions=True)
+        except Exception as e:
+            logger.error(f"Error reading models from `{table_name}`: {e}")
+            raise
+    logger.info(f"[{table_name}] Models downloaded: {count}")
+
+async def process_symbols(pool, fetcher, collection: Collection):
+    settings = get_settings()
+    with open_registry(settings.symbols_registry_path, settings.symbols_path) as registry:
+        logger.info(f"Symbol registry `{settings.symbols_registry_path}` holds {len(registry)} symbols")
+        await resolve_symbols(pool, fetcher, collection, registry)
+
+async def resolve_symbols(pool, fetcher, collection: Collection, registry):
+    table_name = collection.table_name
+    store = PatternStore(registry, collection.patterns_dir)
+    semaphore = asyncio.Semaphore(get_settings().symbol_concurrency)
+
+    async def download_symbol(symbol, number, resolved):
+        url = collection.page_url(number)
+        started = time.perf_counter()
+        try:
+            async with semaphore:
+                png_data = await fetch_pattern_png(fetcher, url, collection.pattern_urls.get(symbol))
+            if png_data is None:
+                SYMBOLS.labels("no_pattern").inc()
+                logger.warning(f"No <image id='giftPattern'> on {url}")
+                return
+            save_path = store.store(png_data)
+            logger.info(f"PNG saved: {save_path}")
+            registry[symbol] = save_path
+            resolved[symbol] = save_path.stem
+            SYMBOLS.labels("downloaded").inc()
+        except Exception as e:
+            SYMBOLS.labels("error").inc()
+            logger.error(f"Error processing symbol '{symbol}' (number: {number}): {e}")
+        finally:
+            SYMBOL_LATENCY.observe(time.perf_counter() - started)
 
     try:
-        await asyncio.to_thread(download_tgs_file, url, TGS_DIR / f"{name}.tgs")
-        logger.info(f"Model {name}.tgs saved")
-    except Exception as e:
-        logger.error(f"Model TGS error for {name}: {e}")
-
-async def download_models(pool):
-    unique = await read_unique_models(pool)
-    logger.info(f"Downloading {len(unique)} models")
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        tasks = [download_model(name, idx, session) for name, idx in unique.items()]
-        await asyncio.gather(*tasks, return_exceptions=True)
-    logger.info("Models downloaded")
-
-@retry(
-    stop=stop_after_attempt(3),
-    wait=wait_exponential(multiplier=1, min=2, max=10),
-    retry=retry_if_exception_type((aiohttp.ClientError, ConnectionResetError))
-)
-async def download_transparent_png_from_svg_async(session, page_url: str, save_path: Path) -> None:
-    try:
-        async with session.get(page_url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-            resp.raise_for_status()
-            text = await resp.text()
-        soup = BeautifulSoup(text, "html.parser")
-        tag = soup.find("image", {"id": "giftPattern"})
-        if not tag or not tag.has_attr("xlink:href"):
-            logger.warning(f"No <image id='giftPattern'> on {page_url}")
-            return
-        png_url = tag["xlink:href"]
-        async with session.get(png_url, timeout=aiohttp.ClientTimeout(total=30)) as png_resp:
-            png_data = await png_resp.read()
-        async with aiofiles.open(save_path, "wb") as f:
-            await f.write(png_data)
-        logger.info(f"PNG saved: {save_path}")
-    except aiohttp.ClientError as e:
-        logger.error(f"Network error downloading {page_url}: {e}")
-        raise
+        async for unresolved in iter_first_numbers(pool, table_name, collection.name, "s", unresolved=True):
+            resolved = {}
+            missing = []
+            for symbol, number in unresolved:
+                path = registry.get(symbol)
+                if path is None:
+                    missing.append((symbol, number))
+                else:
+                    resolved[symbol] = Path(path).stem
+            logger.info(f"[{table_name}] Symbols without s_in_dir: {len(unresolved)}, known: {len(resolved)}, to download: {len(missing)}")
+            SYMBOLS.labels("known").inc(len(resolved))
+
+            await asyncio.gather(*(download_symbol(symbol, number, resolved) for symbol, number in missing))
+
+            if resolved:
+                try:
+                    updated = await apply_symbol_dirs(pool, table_name, collection.name, resolved)
+                    logger.info(f"[{table_name}] Updated s_in_dir for {updated} records ({len(resolved)} symbols)")
+                except Exception as e:
+                    logger.error(f"Error updating s_in_dir: {e}")
     except Exception as e:
-        logger.error(f"Error downloading PNG from {page_url}: {e}")
-        raise
-
-async def process_symbols(pool):
-    try:
-        with open(SYMBOLS_PATH, "r", encoding="utf-8") as f:
-            symbols_data = json.load(f)
-    except FileNotFoundError:
-        logger.warning(f"{SYMBOLS_PATH} not found. Creating empty.")
-        symbols_data = {}
-    symbol_keys = list(symbols_data.keys())
-    logger.info(f"Read {len(symbol_keys)} keys from symbols.json")
-
-    async with pool.acquire() as conn:
-        async with conn.cursor() as cur:
-            try:
-                await cur.execute(
-                    f"SELECT id, number, s FROM `{TABLE_NAME}` WHERE name = %s",
-                    (NFT_NAME.lower(),)
-                )
-                records = await cur.fetchall()
-            except Exception as e:
-                logger.error(f"Error reading records from `{TABLE_NAME}`: {e}")
-                return
-
-    processed_records = [{"id": r[0], "number": r[1], "s": r[2]} for r in records]
-    missing_s_in_dir = []
-
-    for record in processed_records:
-        symbol = record["s"]
-        if symbol in symbol_keys:
-            filename = Path(symbols_data[symbol]).name[:-4]
-            record["s_in_dir"] = filename
-        else:
-            missing_s_in_dir.append((record["id"], record["number"], symbol))
-
-    logger.info(f"Processed {len(processed_records)} records, missing s_in_dir: {len(missing_s_in_dir)}")
-
-    unique_symbols = {}
-    for id_, number, symbol in missing_s_in_dir:
-        if symbol not in unique_symbols:
-            unique_symbols[symbol] = (id_, number)
-
-    pattern_dirs = [d for d in PATTERNS_DIR.iterdir() if d.is_dir() and len(d.name) == 2]
-    if not pattern_dirs:
-        logger.warning(f"No dirs in {PATTERNS_DIR}. Creating 'ab'.")
-        (PATTERNS_DIR / "ab").mkdir(exist_ok=True)
-        pattern_dirs = [PATTERNS_DIR / "ab"]
-    file_counts = {d: len(list(d.iterdir())) for d in pattern_dirs}
-
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    async with aiohttp.ClientSession(headers=HEADERS, connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
-        for symbol, (id_, number) in unique_symbols.items():
-            url = BASE_URL + str(number)
-            min_dir = min(file_counts, key=file_counts.get)
-            xx = min_dir.name[:2]
-            yyyy = ''.join(random.choices(string.ascii_letters + string.digits, k=4))
-            filename = f"{xx}{yyyy}.png"
-            save_path = min_dir / filename
-            try:
-                await download_transparent_png_from_svg_async(session, url, save_path)
-                symbols_data[symbol] = str(save_path)
-                file_counts[min_dir] += 1
-                async with pool.acquire() as conn:
-                    async with conn.cursor() as cur:
-                        try:
-                            await cur.execute(
-                                f"UPDATE `{TABLE_NAME}` SET s_in_dir = %s WHERE s = %s AND name = %s",
-                                (filename[:-4], symbol, NFT_NAME.lower())
-                            )
-                            await conn.commit()
-                            logger.info(f"Updated s_in_dir for symbol '{symbol}' in all matching records")
-                        except Exception as e:
-                            logger.error(f"Error updating s_in_dir for symbol '{symbol}': {e}")
-            except Exception as e:
-                logger.error(f"Error processing symbol '{symbol}' (ID: {id_}, number: {number}): {e}")
-                continue
-
-    with open(SYMBOLS_PATH, "w", encoding="utf-8") as f:
-        json.dump(symbols_data, f, ensure_ascii=False, indent=4)
-    logger.info("Updated symbols.json saved")
-
-async def main():
+        logger.error(f"Error reading records from `{table_name}`: {e}")
+
+async def run_collection(pool, fetcher, collection: Collection, resume: bool = False,
+                         workers: int = None, render_executor=None, refresh: bool = False):
+    collection.prepare_dirs()
+    await create_table(pool, collection.table_name)
+    if refresh:
+        await refresh_all(pool, fetcher, collection, workers)
+    else:
+        await save_all_to_db(pool, fetcher, collection, resume, workers)
+    await download_models(pool, fetcher, collection, render_executor)
+    await process_symbols(pool, fetcher, collection)
+    settings = get_settings()
+    if settings.trait_summary:
+        await sync_trait_summary(pool, collection.table_name, collection.name)
+    if settings.rarity_index:
+        from rarity import load_rarity_index
+        await load_rarity_index(pool, collection.table_name, collection.name, collection.rarity_path)
+
+async def main(resume: bool = False, refresh: bool = False):
     start = time.time()
-    prepare_dirs_and_index()
+    collection = Collection.from_env()
     pool = await create_pool()
+    metrics_task = asyncio.create_task(report_metrics())
     try:
-        await create_table(pool, TABLE_NAME)
-        await save_all_to_db(pool)
-        await download_models(pool)
-        await process_symbols(pool)
+        await create_dead_letter_table(pool)
+        await create_page_state_table(pool)
+        async with create_session() as session:
+            fetcher = Fetcher(session)
+            await run_collection(pool, fetcher, collection, resume, refresh=refresh)
     finally:
+        metrics_task.cancel()
         pool.close()
         await pool.wait_closed()
     logger.info(f"Execution completed in {time.time() - start:.2f}s")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="continue from the last checkpoint")
+    parser.add_argument("--refresh", action="store_true", help="re-check every page and write only the changed ones")
+    args = parser.parse_args()
+    asyncio.run(main(args.resume, args.refresh))
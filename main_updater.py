@@ -1,67 +1,172 @@
 import asyncio
 import logging
-import os
-import aiohttp
+import time
+from functools import partial
+from typing import Optional
 
-from database import create_pool, list_tables, insert_nft_batch
-from main import get_current_quantity, parse_page, HEADERS, BATCH_SIZE
-
-UPDATE_INTERVAL = 1
+from database import create_pool, create_dead_letter_table, list_tables, insert_nft_batch, read_collection_name
+from scraper import get_current_quantity, parse_page
+from http_client import Fetcher, create_session
+from metrics import report_metrics
+from pipeline import run_pipeline
+from migrations import migrate
+from dead_letters import DeadLetterQueue, retry_scheduler
+from collection import Collection, name_from_table
+from settings import Settings, get_settings
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-async def update_table(pool, table_name: str):
+class CollectionState:
+    def __init__(self, collection: Collection, settings: Settings):
+        self.table_name = collection.table_name
+        self.collection = collection
+        self.settings = settings
+        self.last_max = None
+        self.interval = settings.min_poll_interval
+        self.rarity = None
+
+    def adapt(self, minted: int):
+        # Poll twice as often while a collection is minting, back off gradually while it is quiet.
+        if minted:
+            self.interval = max(self.settings.min_poll_interval, self.interval / 2)
+        else:
+            self.interval = min(self.settings.max_poll_interval, self.interval * 1.5)
+
+async def read_max_number(pool, table_name: str) -> int:
     async with pool.acquire() as conn:
         async with conn.cursor() as cur:
             await cur.execute(f"SELECT COALESCE(MAX(number), 0) FROM `{table_name}`")
             (max_db,) = await cur.fetchone()
-    logger.info(f"[{table_name}] Last number in DB: {max_db}")
-
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        total_site = await get_current_quantity(session)
-    logger.info(f"[{table_name}] Current quantity on the website: {total_site}")
-
-    if total_site > max_db:
-        missing = list(range(max_db + 1, total_site + 1))
-        logger.info(f"[{table_name}] New numbers: {missing[0]}–{missing[-1]}")
-
-        for i in range(0, len(missing), BATCH_SIZE):
-            batch_nums = missing[i : i + BATCH_SIZE]
-            logger.info(f"[{table_name}] Batch processing: {batch_nums[0]}–{batch_nums[-1]}")
-
-            async with aiohttp.ClientSession(headers=HEADERS) as session:
-                tasks = [parse_page(session, num) for num in batch_nums]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            valid = [res[1] for res in results if not isinstance(res, Exception) and res[1] is not None]
-            if valid:
-                await insert_nft_batch(pool, valid, table_name)
-                logger.info(f"[{table_name}] Entries inserted: {len(valid)}")
-                for record in valid:
-                    link = f"t.me/nft/{table_name}-{record['number']}"
-                    logger.info(f"[{table_name}] Link: {link}")
-    else:
-        logger.info(f"[{table_name}] The database is already up to date.")
+    return max_db
+
+async def update_table(pool, fetcher, state: CollectionState) -> int:
+    table_name, settings = state.table_name, state.settings
+    if state.last_max is None:
+        state.last_max = await read_max_number(pool, table_name)
+        logger.info(f"[{table_name}] Last number in DB: {state.last_max}")
+    if settings.rarity_index and state.rarity is None:
+        from rarity import load_rarity_index
+        state.rarity = await load_rarity_index(pool, table_name, state.collection.name, state.collection.rarity_path)
+
+    total_site = await get_current_quantity(fetcher, state.collection)
+    if total_site <= state.last_max:
+        logger.debug(f"[{table_name}] The database is already up to date.")
+        return 0
+
+    logger.info(f"[{table_name}] New numbers: {state.last_max + 1}–{total_site}")
+    dlq = DeadLetterQueue(pool, table_name)
+
+    async def write_batch(valid):
+        try:
+            await insert_nft_batch(pool, valid, table_name)
+        except Exception as e:
+            for record in valid:
+                dlq.add(record.number, e)
+            raise
+        logger.info(f"[{table_name}] Entries inserted: {len(valid)} ({valid[0].number}–{valid[-1].number})")
+        if state.rarity is not None:
+            state.rarity.extend(valid)
+        if logger.isEnabledFor(logging.DEBUG):
+            for record in valid:
+                logger.debug(f"[{table_name}] Link: t.me/nft/{state.collection.name}-{record.number}")
+
+    minted = total_site - state.last_max
+    await run_pipeline(
+        range(state.last_max + 1, total_site + 1),
+        partial(parse_page, fetcher, state.collection),
+        write_batch,
+        workers=min(settings.workers, minted),
+        flush_size=settings.batch_size,
+        flush_interval=settings.flush_interval,
+        on_failed=dlq.add,
+    )
+    await dlq.flush()
+    if state.rarity is not None:
+        from rarity import save_snapshot
+        # Snapshot on the loop: a dead-letter retry can extend the index while the thread writes it.
+        await asyncio.to_thread(save_snapshot, state.rarity.snapshot(), state.collection.rarity_path)
+    # Numbers that failed are in the dead-letter table, so the cached max can move past them;
+    # the ones that could not be dead-lettered either are crawled again on the next poll.
+    pending = dlq.pending
+    state.last_max = pending[0] - 1 if pending else total_site
+    if pending:
+        logger.warning(f"[{table_name}] {len(pending)} numbers were not dead-lettered, resuming from {pending[0]}")
+    return minted
+
+async def watch_collection(pool, fetcher, state: CollectionState):
+    while True:
+        started = time.monotonic()
+        try:
+            minted = await update_table(pool, fetcher, state)
+            state.adapt(minted)
+        except Exception as e:
+            logger.error(f"Table update error {state.table_name}: {e}")
+            state.adapt(0)
+        await asyncio.sleep(max(state.interval - (time.monotonic() - started), 0))
+
+async def read_collection(pool, table_name: str) -> Optional[Collection]:
+    # TABLE_NAME can be any template, so the collection name comes from the rows, not the table name.
+    name = await read_collection_name(pool, table_name) or name_from_table(table_name)
+    return Collection(name, table_name=table_name) if name else None
 
 async def main():
+    settings = get_settings()
     pool = await create_pool()
+    session = create_session()
+    fetcher = Fetcher(session)
+    await create_dead_letter_table(pool)
+    states = {}
+
+    def fetch_for_table(table_name: str):
+        # Tables without a watcher yet are retried once their collection is known.
+        state = states.get(table_name)
+        return partial(parse_page, fetcher, state.collection) if state else None
+
+    def on_retried(table_name: str, records: list):
+        # Recovered dead letters fill holes below the cached max, so they go into the rarity index too.
+        state = states.get(table_name)
+        if state and state.rarity is not None:
+            state.rarity.extend(records)
+
+    retry_task = asyncio.create_task(
+        retry_scheduler(pool, fetch_for_table, settings.batch_size, on_written=on_retried)
+    )
+    metrics_task = asyncio.create_task(report_metrics())
+    watchers = {}
     try:
         while True:
-            tables = await list_tables(pool)
-            logger.info(f"Tables for updating: {tables}")
-
-            for tbl in tables:
+            tables = set(await list_tables(pool))
+            for tbl in tables - watchers.keys():
                 try:
-                    await update_table(pool, tbl)
+                    await migrate(pool, tbl)
                 except Exception as e:
-                    logger.error(f"Table update error {tbl}: {e}")
+                    logger.error(f"Table migration error {tbl}: {e}")
+                    continue
+                collection = await read_collection(pool, tbl)
+                if collection is None:
+                    logger.warning(f"`{tbl}` is empty and does not match TABLE_NAME, skipping it until it has rows")
+                    continue
+                logger.info(f"Watching `{tbl}` ({collection.name})")
+                states[tbl] = CollectionState(collection, settings)
+                watchers[tbl] = asyncio.create_task(watch_collection(pool, fetcher, states[tbl]))
+            for tbl in watchers.keys() - tables:
+                logger.info(f"Table `{tbl}` is gone, stopping its watcher")
+                watchers.pop(tbl).cancel()
+                states.pop(tbl, None)
 
-            logger.info(f"All tables have been processed. Next through {UPDATE_INTERVAL} seconds.")
-            await asyncio.sleep(UPDATE_INTERVAL)
+            await asyncio.sleep(settings.tables_refresh_interval)
     finally:
+        for task in watchers.values():
+            task.cancel()
+        retry_task.cancel()
+        metrics_task.cancel()
+        await session.close()
         pool.close()
         await pool.wait_closed()
 
 if __name__ == '__main__':
+    from dotenv import load_dotenv
+
+    load_dotenv()
     asyncio.run(main())
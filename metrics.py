@@ -0,0 +1,238 @@
+import asyncio
+import bisect
+import logging
+
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BATCH_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._child()
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def _default(self):
+        return self.labels()
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._expose_child(values, child))
+        return lines
+
+class _Value:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function else self.value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default().inc(amount)
+
+    def total(self) -> float:
+        return sum(child.get() for child in self._children.values())
+
+    def _expose_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {child.get():g}"]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation; coarse, but free to keep.
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _expose_child(self, values, child):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            le_label = f'le="{le}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le_label)} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {child.sum:g}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def expose(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter("nft_http_requests_total", "HTTP responses by status code", ["status"])
+HTTP_ERRORS = REGISTRY.counter("nft_http_errors_total", "Requests that failed without a response")
+HTTP_RETRIES = REGISTRY.counter("nft_http_retries_total", "Request attempts retried after a failure")
+HTTP_BYTES = REGISTRY.counter("nft_http_bytes_total", "Response body bytes downloaded")
+HTTP_LATENCY = REGISTRY.histogram("nft_http_request_seconds", "Time from request start to full body")
+HTTP_CACHE_HITS = REGISTRY.counter("nft_http_cache_hits_total", "Fetches served from the in-memory cache")
+RATE_LIMIT = REGISTRY.gauge("nft_rate_limit", "Current adaptive request rate, req/s")
+
+PIPELINE_ITEMS = REGISTRY.counter("nft_pipeline_items_total", "Items leaving each pipeline stage", ["stage"])
+QUEUE_DEPTH = REGISTRY.gauge("nft_queue_depth", "Items waiting in a pipeline queue", ["queue"])
+PARSE_LATENCY = REGISTRY.histogram("nft_parse_seconds", "Time to parse one gift page", buckets=(
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+))
+SINK_LATENCY = REGISTRY.histogram("nft_sink_batch_seconds", "Time to flush one batch to the sink", buckets=BATCH_BUCKETS)
+
+DB_ROWS = REGISTRY.counter("nft_db_rows_total", "Rows written to collection tables", ["mode"])
+DB_LATENCY = REGISTRY.histogram("nft_db_write_seconds", "Time to write one batch to MySQL", ["mode"], BATCH_BUCKETS)
+
+RENDERS = REGISTRY.counter("nft_models_total", "Model assets processed", ["result"])
+RENDER_LATENCY = REGISTRY.histogram("nft_model_render_seconds", "Time to fetch, render and save one model", buckets=BATCH_BUCKETS)
+
+REFRESH_PAGES = REGISTRY.counter("nft_refresh_pages_total", "Pages checked by a refresh, by outcome", ["result"])
+
+SYMBOLS = REGISTRY.counter("nft_symbols_total", "Symbols processed", ["result"])
+SYMBOL_LATENCY = REGISTRY.histogram("nft_symbol_seconds", "Time to fetch and store one pattern")
+
+def summary() -> str:
+    requests = HTTP_REQUESTS.total()
+    latency = HTTP_LATENCY._default()
+    statuses = ", ".join(f"{values[0]}: {child.get():.0f}" for values, child in sorted(HTTP_REQUESTS._children.items()))
+    stages = ", ".join(f"{values[0]} {child.get():.0f}" for values, child in sorted(PIPELINE_ITEMS._children.items()))
+    rows = DB_ROWS.total()
+    return (
+        f"Requests: {requests:.0f} ({statuses or 'none'}), retries {HTTP_RETRIES.total():.0f}, "
+        f"errors {HTTP_ERRORS.total():.0f}, {HTTP_BYTES.total() / 2 ** 20:.1f} MB, "
+        f"p50 <= {latency.quantile(0.5):g}s, p99 <= {latency.quantile(0.99):g}s, "
+        f"rate {RATE_LIMIT.total():.1f} req/s; items: {stages or 'none'}; DB rows {rows:.0f}; "
+        f"models {RENDERS.total():.0f}; symbols {SYMBOLS.total():.0f}"
+    )
+
+async def start_metrics_server(port: int = None, host: str = None):
+    from aiohttp import web
+
+    settings = get_settings()
+    port = settings.metrics_port if port is None else port
+    host = host or settings.metrics_host
+
+    async def handle(request):
+        return web.Response(text=REGISTRY.expose(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics at http://{host}:{port}/metrics")
+    return runner
+
+async def report_metrics(interval: float = None, port: int = None):
+    settings = get_settings()
+    interval = interval or settings.metrics_interval
+    port = settings.metrics_port if port is None else port
+    runner = await start_metrics_server(port) if port else None
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(summary())
+    finally:
+        if runner is not None:
+            await runner.cleanup()
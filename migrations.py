@@ -0,0 +1,173 @@
+import logging
+
+import aiomysql
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION_TABLE = "schema_version"
+# Per-collection trait counts; the table keeps its original name so existing databases still skip it.
+TRAIT_SUMMARY_TABLE = "traits"
+
+async def _index_exists(cur, table_name: str, index_name: str) -> bool:
+    await cur.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """,
+        (table_name, index_name)
+    )
+    (count,) = await cur.fetchone()
+    return count > 0
+
+async def _add_unique_name_number(cur, table_name: str):
+    if await _index_exists(cur, table_name, "uq_name_number"):
+        return
+    await cur.execute(
+        f"""
+        DELETE t1 FROM `{table_name}` t1
+        JOIN `{table_name}` t2
+            ON t1.name = t2.name AND t1.number = t2.number AND t1.id > t2.id
+        """
+    )
+    await cur.execute(f"ALTER TABLE `{table_name}` ADD UNIQUE KEY uq_name_number (name(64), number)")
+
+async def _varchar_and_indexes(cur, table_name: str):
+    await cur.execute(
+        f"""
+        ALTER TABLE `{table_name}`
+            DROP INDEX uq_name_number,
+            MODIFY name VARCHAR(64) NOT NULL,
+            MODIFY m VARCHAR(255) NOT NULL,
+            MODIFY bd VARCHAR(255) NOT NULL,
+            MODIFY s VARCHAR(255) NOT NULL,
+            ADD UNIQUE KEY uq_name_number (name, number),
+            ADD INDEX idx_number (number),
+            ADD INDEX idx_m (m),
+            ADD INDEX idx_bd (bd),
+            ADD INDEX idx_s (s)
+        """
+    )
+
+async def _updated_at(cur, table_name: str):
+    # Only changed values bump ON UPDATE, so the column tracks inserts and real trait changes.
+    await cur.execute(
+        f"""
+        ALTER TABLE `{table_name}`
+            ADD COLUMN updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            ADD INDEX idx_updated_at (updated_at)
+        """
+    )
+
+# Each entry upgrades a collection table from version N to N + 1; never edit or reorder them.
+MIGRATIONS = [
+    _add_unique_name_number,
+    _varchar_and_indexes,
+    _updated_at,
+]
+LATEST_VERSION = len(MIGRATIONS)
+
+NFT_TABLE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS `{table_name}` (
+        id INTEGER PRIMARY KEY AUTO_INCREMENT,
+        name VARCHAR(64) NOT NULL,
+        number INTEGER NOT NULL,
+        m VARCHAR(255) NOT NULL,
+        bd VARCHAR(255) NOT NULL,
+        s VARCHAR(255) NOT NULL,
+        mchance INTEGER NOT NULL,
+        bdchance INTEGER NOT NULL,
+        schance INTEGER NOT NULL,
+        hex1 CHAR(7),
+        hex2 CHAR(7),
+        s_in_dir CHAR(6),
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        UNIQUE KEY uq_name_number (name, number),
+        INDEX idx_number (number),
+        INDEX idx_m (m),
+        INDEX idx_bd (bd),
+        INDEX idx_s (s),
+        INDEX idx_updated_at (updated_at)
+    )
+"""
+
+async def _create_version_table(cur):
+    await cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS `{SCHEMA_VERSION_TABLE}` (
+            table_name VARCHAR(64) PRIMARY KEY,
+            version INTEGER NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """
+    )
+
+async def _set_version(cur, table_name: str, version: int):
+    await cur.execute(
+        f"""
+        INSERT INTO `{SCHEMA_VERSION_TABLE}` (table_name, version) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE version = VALUES(version)
+        """,
+        (table_name, version)
+    )
+
+async def get_version(cur, table_name: str) -> int:
+    await cur.execute(f"SELECT version FROM `{SCHEMA_VERSION_TABLE}` WHERE table_name = %s", (table_name,))
+    row = await cur.fetchone()
+    return row[0] if row else 0
+
+async def create_nft_table(pool: aiomysql.Pool, table_name: str):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await _create_version_table(cur)
+            await cur.execute(
+                "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s",
+                (table_name,)
+            )
+            (exists,) = await cur.fetchone()
+            if not exists:
+                await cur.execute(NFT_TABLE_SCHEMA.format(table_name=table_name))
+                await _set_version(cur, table_name, LATEST_VERSION)
+                await conn.commit()
+                logger.info(f"[{table_name}] Created at schema version {LATEST_VERSION}")
+    await migrate(pool, table_name)
+
+async def migrate(pool: aiomysql.Pool, table_name: str) -> int:
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await _create_version_table(cur)
+            version = await get_version(cur, table_name)
+            for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                logger.info(f"[{table_name}] Migrating schema to version {target}")
+                await migration(cur, table_name)
+                await _set_version(cur, table_name, target)
+                await conn.commit()
+                version = target
+    return version
+
+async def sync_trait_summary(pool: aiomysql.Pool, table_name: str, name: str):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS `{TRAIT_SUMMARY_TABLE}` (
+                    table_name VARCHAR(64) NOT NULL,
+                    kind ENUM('m', 'bd', 's') NOT NULL,
+                    value VARCHAR(255) NOT NULL,
+                    first_number INTEGER NOT NULL,
+                    items INTEGER NOT NULL,
+                    PRIMARY KEY (table_name, kind, value)
+                )
+                """
+            )
+            # Rebuilt in one transaction, so values that no longer occur drop out of the summary.
+            await cur.execute(f"DELETE FROM `{TRAIT_SUMMARY_TABLE}` WHERE table_name = %s", (table_name,))
+            for kind in ("m", "bd", "s"):
+                await cur.execute(
+                    f"""
+                    INSERT INTO `{TRAIT_SUMMARY_TABLE}` (table_name, kind, value, first_number, items)
+                    SELECT %s, %s, `{kind}`, MIN(number), COUNT(*) FROM `{table_name}`
+                    WHERE name = %s GROUP BY `{kind}`
+                    """,
+                    (table_name, kind, name)
+                )
+            await conn.commit()
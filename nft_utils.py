@@ -1,75 +1,35 @@
-import requests
-from bs4 import BeautifulSoup
-from rlottie_python import LottieAnimation
-from PIL import Image
-import io
-import gzip
-import aiohttp
-from lxml.html import fromstring
+import aiofiles
 import asyncio
+from functools import partial
+from typing import Optional
+from gift_parser import parse_gift_page
+from renderer import render_model, write_tgs_as_json
 
-def get_first_frame_from_tgs_page(page_url: str, scale: float = 1.0) -> Image.Image:
-    resp = requests.get(page_url, timeout=10)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-    tag = soup.find("source", {"type": "application/x-tgsticker"})
-    if not tag or not tag.has_attr("srcset"):
-        raise RuntimeError
-    tgs_url = tag["srcset"]
-    tgs_data = requests.get(tgs_url, timeout=10).content
-    anim = LottieAnimation.from_tgs(io.BytesIO(tgs_data))
-    w, h = anim.lottie_animation_get_size()
-    buf = anim.lottie_animation_render(frame_num=0)
-    return Image.frombuffer("RGBA", (int(w * scale), int(h * scale)), buf, "raw", "BGRA")
+async def fetch_tgs_data(fetcher, page_url: str, tgs_url: str = None) -> bytes:
+    # tgs_url comes from the crawl; only models it did not see this run need their sample page.
+    # Every URL here is downloaded once per run, so none of them go through the cache.
+    tgs_url = tgs_url or parse_gift_page(await fetcher.get_bytes(page_url, cache=False)).tgs_url
+    if not tgs_url:
+        raise RuntimeError(f"No .tgs source on {page_url}")
+    return await fetcher.get_bytes(tgs_url, cache=False)
 
-def download_tgs_file(page_url: str, save_path: str) -> None:
-    resp = requests.get(page_url, timeout=10)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-    tag = soup.find("source", {"type": "application/x-tgsticker"})
-    if not tag or not tag.has_attr("srcset"):
-        raise RuntimeError
-    tgs_url = tag["srcset"]
-    tgs_data = requests.get(tgs_url, timeout=10).content
-    with open(save_path, "wb") as f:
-        f.write(tgs_data)
-        
-def download_and_save_tgs_as_json(page_url: str, json_filename: str) -> None:
-    resp = requests.get(page_url, timeout=10)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-    tag = soup.find("source", {"type": "application/x-tgsticker"})
-    if not tag or not tag.has_attr("srcset"):
-        raise RuntimeError
-    tgs_url = tag["srcset"]
-    tgs_data = requests.get(tgs_url, timeout=10).content
-    with gzip.GzipFile(fileobj=io.BytesIO(tgs_data)) as gz:
-        json_bytes = gz.read()
-    with open(json_filename, "wb") as f:
-        f.write(json_bytes)
+async def save_model_assets(fetcher, page_url: str, png_path, json_path, tgs_path, executor=None,
+                            previews=None, tgs_url: str = None) -> None:
+    tgs_data = await fetch_tgs_data(fetcher, page_url, tgs_url)
+    # The .tgs goes first so every output is newer than it and counts as up to date on the next run.
+    async with aiofiles.open(tgs_path, "wb") as f:
+        await f.write(tgs_data)
 
-def download_transparent_png_from_svg(page_url: str, save_path: str) -> None:
-    resp = requests.get(page_url, timeout=10)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
-    tag = soup.find("image", {"id": "giftPattern"})
-    if not tag or not tag.has_attr("xlink:href"):
-        return
-    png_url = tag["xlink:href"]
-    png_data = requests.get(png_url, timeout=10).content
-    with open(save_path, "wb") as f:
-        f.write(png_data)
+    loop = asyncio.get_running_loop()
+    render = loop.run_in_executor(executor, partial(render_model, tgs_data, png_path, previews))
+    try:
+        await asyncio.to_thread(write_tgs_as_json, tgs_data, json_path)
+    finally:
+        # A running render cannot be cancelled, so it is awaited even when the JSON write failed.
+        await render
 
-async def get_current_quantity(session):
-    async with throttler, session.get(BASE_URL + "1") as resp:
-        resp.raise_for_status()
-        text = await resp.text()
-    tree = html.fromstring(text)
-    qty = tree.xpath(
-        '//table[contains(@class,"tgme_gift_table")]'
-        '//tr[th[contains(translate(., "Q","q"), "quantity")]]/td/text()'
-    )
-    if not qty:
-        logger.error("Quantity field not found")
-        raise RuntimeError("Quantity field not found")
-    return int(qty[0].split('/')[0].replace('\u00A0', '').replace(',', ''))
+async def fetch_pattern_png(fetcher, page_url: str, pattern_url: str = None) -> Optional[bytes]:
+    pattern_url = pattern_url or parse_gift_page(await fetcher.get_bytes(page_url, cache=False)).pattern_url
+    if not pattern_url:
+        return None
+    return await fetcher.get_bytes(pattern_url, cache=False)
@@ -0,0 +1,56 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+class PatternStore:
+    def __init__(self, registry, patterns_dir):
+        self.conn = registry.conn
+        self.patterns_dir = Path(patterns_dir)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS patterns (
+                digest TEXT PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+            """
+        )
+        # Shards come from the digest prefix, so the per-shard file counters older versions kept are unused.
+        self.conn.execute("DROP TABLE IF EXISTS shard_counts")
+
+    def _candidate_names(self, digest: str):
+        # Names stay 6 characters to fit s_in_dir CHAR(6): the shard plus a 4-char window of the digest,
+        # shifted along the digest on the rare collision with another pattern or a legacy file.
+        shard = digest[:2]
+        for start in range(2, len(digest) - 3):
+            yield shard + digest[start:start + 4]
+
+    def store(self, data: bytes) -> Path:
+        digest = hashlib.sha256(data).hexdigest()
+        shard_dir = self.patterns_dir / digest[:2]
+        row = self.conn.execute("SELECT name FROM patterns WHERE digest = ?", (digest,)).fetchone()
+        if row and (shard_dir / f"{row[0]}.png").exists():
+            return shard_dir / f"{row[0]}.png"
+
+        for name in self._candidate_names(digest):
+            owner = self.conn.execute("SELECT digest FROM patterns WHERE name = ?", (name,)).fetchone()
+            if owner is not None:
+                if owner[0] == digest:
+                    break
+                continue
+            if not (shard_dir / f"{name}.png").exists():
+                break
+        else:
+            raise RuntimeError(f"No free pattern name for digest {digest}")
+
+        shard_dir.mkdir(parents=True, exist_ok=True)
+        path = shard_dir / f"{name}.png"
+        tmp_path = path.with_suffix(".png.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self.conn.execute("INSERT OR REPLACE INTO patterns (digest, name) VALUES (?, ?)", (digest, name))
+        return path
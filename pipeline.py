@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+
+from metrics import PARSE_LATENCY, PIPELINE_ITEMS, QUEUE_DEPTH, SINK_LATENCY
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+# A fetch can return (idx, SKIPPED) for an item that needs no write, e.g. an unchanged page on refresh.
+SKIPPED = object()
+
+_FETCHED = PIPELINE_ITEMS.labels("fetched")
+_PARSED = PIPELINE_ITEMS.labels("parsed")
+_FAILED = PIPELINE_ITEMS.labels("failed")
+_WRITTEN = PIPELINE_ITEMS.labels("written")
+_SINK_FAILED = PIPELINE_ITEMS.labels("sink_failed")
+_SKIPPED = PIPELINE_ITEMS.labels("skipped")
+_IDS_DEPTH = QUEUE_DEPTH.labels("ids")
+
+async def _produce(numbers, id_queue: asyncio.Queue, workers: int):
+    for idx in numbers:
+        await id_queue.put(idx)
+        _IDS_DEPTH.set(id_queue.qsize())
+    for _ in range(workers):
+        await id_queue.put(_DONE)
+
+async def _fetch_worker(fetch, id_queue: asyncio.Queue, out_queue: asyncio.Queue, stats: dict, on_failed, raw: bool):
+    while True:
+        idx = await id_queue.get()
+        if idx is _DONE:
+            return
+        try:
+            _, record = await fetch(idx)
+        except Exception as e:
+            stats["failed"] += 1
+            _FAILED.inc()
+            logger.error(f"[{idx}] Fetch failed: {e}")
+            if on_failed:
+                on_failed(idx, e)
+            continue
+        if record is SKIPPED:
+            stats["skipped"] += 1
+            _SKIPPED.inc()
+            continue
+        if record is None:
+            stats["failed"] += 1
+            _FAILED.inc()
+            if on_failed:
+                on_failed(idx, None)
+            continue
+        _FETCHED.inc()
+        await out_queue.put((idx, record) if raw else record)
+
+async def _parse_stage(parse_batch, executor, parse_queue: asyncio.Queue, out_queue: asyncio.Queue,
+                       chunk_size: int, stats: dict, on_failed, on_parsed):
+    loop = asyncio.get_running_loop()
+    done = False
+    while not done:
+        chunk = []
+        item = await parse_queue.get()
+        while True:
+            if item is _DONE:
+                done = True
+                break
+            chunk.append(item)
+            if len(chunk) >= chunk_size or parse_queue.empty():
+                break
+            item = parse_queue.get_nowait()
+        if not chunk:
+            continue
+
+        QUEUE_DEPTH.labels("parse").set(parse_queue.qsize())
+        started = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(executor, parse_batch, chunk)
+        except Exception as e:
+            logger.error(f"Parse worker failed on {len(chunk)} pages: {e}")
+            results = [(idx, None, e, None) for idx, _ in chunk]
+        per_page = (time.perf_counter() - started) / len(chunk)
+        for idx, record, error, extra in results:
+            PARSE_LATENCY.observe(per_page)
+            if record is None:
+                stats["failed"] += 1
+                _FAILED.inc()
+                logger.error(f"[{idx}] Parse failed: {error}")
+                if on_failed:
+                    on_failed(idx, error)
+                continue
+            _PARSED.inc()
+            if on_parsed:
+                on_parsed(record, *extra)
+            await out_queue.put(record)
+
+async def _sink_stage(sink, out_queue: asyncio.Queue, flush_size: int, flush_interval: float, stats: dict):
+    buffer = []
+    last_flush = time.monotonic()
+
+    async def flush():
+        nonlocal buffer, last_flush
+        batch, buffer = buffer, []
+        last_flush = time.monotonic()
+        if not batch:
+            return
+        QUEUE_DEPTH.labels("out").set(out_queue.qsize())
+        flush_start = time.perf_counter()
+        try:
+            await sink(batch)
+            stats["written"] += len(batch)
+            _WRITTEN.inc(len(batch))
+        except Exception as e:
+            _SINK_FAILED.inc(len(batch))
+            logger.error(f"Sink error for {len(batch)} records: {e}")
+        elapsed = time.perf_counter() - flush_start
+        SINK_LATENCY.observe(elapsed)
+        logger.debug(f"Flushed {len(batch)} records in {elapsed:.2f}s")
+
+    while True:
+        timeout = max(flush_interval - (time.monotonic() - last_flush), 0)
+        try:
+            record = await asyncio.wait_for(out_queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            await flush()
+            continue
+        if record is _DONE:
+            await flush()
+            return
+        buffer.append(record)
+        if len(buffer) >= flush_size:
+            await flush()
+
+async def run_pipeline(numbers, fetch, sink, workers: int, flush_size: int, flush_interval: float = 1.0,
+                       on_failed=None, parse_batch=None, executor=None, parse_workers: int = 0,
+                       parse_chunk: int = 64, on_parsed=None) -> dict:
+    # With parse_batch set, fetch returns (idx, raw page) and parse_workers dispatchers
+    # hand chunks of pages to parse_batch on the executor, which returns (idx, record, error, extra);
+    # on_parsed(record, *extra) runs in the event loop for every parsed record.
+    stats = {"failed": 0, "written": 0, "skipped": 0}
+    id_queue = asyncio.Queue(maxsize=workers * 2)
+    out_queue = asyncio.Queue(maxsize=flush_size * 2)
+
+    sink_task = asyncio.create_task(_sink_stage(sink, out_queue, flush_size, flush_interval, stats))
+    parse_tasks = []
+    fetch_queue = out_queue
+    if parse_batch is not None:
+        fetch_queue = asyncio.Queue(maxsize=parse_chunk * parse_workers * 2)
+        parse_tasks = [
+            asyncio.create_task(
+                _parse_stage(parse_batch, executor, fetch_queue, out_queue, parse_chunk, stats, on_failed, on_parsed)
+            )
+            for _ in range(parse_workers)
+        ]
+    worker_tasks = [
+        asyncio.create_task(_fetch_worker(fetch, id_queue, fetch_queue, stats, on_failed, bool(parse_tasks)))
+        for _ in range(workers)
+    ]
+    try:
+        await _produce(numbers, id_queue, workers)
+        await asyncio.gather(*worker_tasks)
+        if parse_tasks:
+            for _ in parse_tasks:
+                await fetch_queue.put(_DONE)
+            await asyncio.gather(*parse_tasks)
+        await out_queue.put(_DONE)
+        await sink_task
+    except BaseException:
+        for task in worker_tasks + parse_tasks + [sink_task]:
+            task.cancel()
+        raise
+    return stats
@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from database import create_pool, read_collection_name, stream_rows
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Rows re-read from before the last sync, for writes that were still uncommitted while it ran.
+SYNC_MARGIN = 60
+
+KINDS = ("m", "bd", "s")
+CHANCES = {"m": "mchance", "bd": "bdchance", "s": "schance"}
+# Column order of the tuples extend_rows takes: number, then the traits, then their chances.
+ROW_COLUMNS = ("number", *KINDS, *(CHANCES[kind] for kind in KINDS))
+
+class _Vocabulary:
+    def __init__(self, values=()):
+        self.values = list(values)
+        self.codes = {value: code for code, value in enumerate(self.values)}
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, values) -> np.ndarray:
+        codes = self.codes
+        out = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self.values)
+                self.values.append(value)
+            out[i] = code
+        return out
+
+class RarityIndex:
+    def __init__(self, table_name: str):
+        self.table_name = table_name
+        self.size = 0
+        self.numbers = np.empty(0, dtype=np.int32)
+        self.codes = {kind: np.empty(0, dtype=np.int32) for kind in KINDS}
+        self.chances = {kind: np.empty(0, dtype=np.int32) for kind in KINDS}
+        self.vocab = {kind: _Vocabulary() for kind in KINDS}
+        self.counts = {kind: np.zeros(0, dtype=np.int64) for kind in KINDS}
+        # Dense number -> row lookup; numbers are sequential from 1, so this stays about as long as the table.
+        self.positions = np.full(1, -1, dtype=np.int64)
+        # Database time (unix seconds) up to which rows are known to be in the index; 0 until the first sync.
+        self.synced_at = 0
+        self._scores = None
+        self._ranks = None
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, size: int):
+        capacity = len(self.numbers)
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2, 1024)
+        self.numbers = np.resize(self.numbers, capacity)
+        for kind in KINDS:
+            self.codes[kind] = np.resize(self.codes[kind], capacity)
+            self.chances[kind] = np.resize(self.chances[kind], capacity)
+
+    def _reserve_numbers(self, max_number: int):
+        if max_number < len(self.positions):
+            return
+        grown = np.full(max(max_number + 1, len(self.positions) * 2), -1, dtype=np.int64)
+        grown[:len(self.positions)] = self.positions
+        self.positions = grown
+
+    def extend(self, records) -> int:
+        return self.extend_rows([tuple(getattr(r, column) for column in ROW_COLUMNS) for r in records if r is not None])
+
+    def extend_rows(self, rows) -> int:
+        if not rows:
+            return 0
+        columns = list(zip(*rows))
+        numbers = np.fromiter(columns[0], dtype=np.int32, count=len(rows))
+        # A number seen twice in one batch keeps its last record, like the upsert in the database.
+        numbers, last = np.unique(numbers[::-1], return_index=True)
+        last = len(rows) - 1 - last
+
+        self._reserve_numbers(int(numbers.max()))
+        rows = self.positions[numbers]
+        known = rows >= 0
+        fresh = ~known
+        new_rows = np.arange(self.size, self.size + int(fresh.sum()), dtype=np.int64)
+        rows[fresh] = new_rows
+        self._reserve(self.size + len(new_rows))
+
+        for i, kind in enumerate(KINDS, 1):
+            values, chance_values = columns[i], columns[i + len(KINDS)]
+            codes = self.vocab[kind].encode([values[j] for j in last])
+            chances = np.fromiter((chance_values[j] for j in last), dtype=np.int32, count=len(last))
+            counts = self.counts[kind]
+            if len(counts) < len(self.vocab[kind]):
+                counts = np.concatenate([counts, np.zeros(len(self.vocab[kind]) - len(counts), dtype=np.int64)])
+            if known.any():
+                np.subtract.at(counts, self.codes[kind][rows[known]], 1)
+            counts += np.bincount(codes, minlength=len(counts))
+            self.counts[kind] = counts
+            self.codes[kind][rows] = codes
+            self.chances[kind][rows] = chances
+
+        self.numbers[rows] = numbers
+        self.positions[numbers] = rows
+        self.size += len(new_rows)
+        self._scores = None
+        self._ranks = None
+        return len(last)
+
+    def frequencies(self, kind: str) -> dict:
+        counts = self.counts[kind]
+        total = max(self.size, 1)
+        order = np.argsort(counts, kind="stable")
+        return {self.vocab[kind].values[code]: (int(counts[code]), float(counts[code] / total)) for code in order if counts[code]}
+
+    @property
+    def scores(self) -> np.ndarray:
+        # Information content of the trait combination: rarer traits add more bits.
+        if self._scores is None:
+            n = self.size
+            scores = np.zeros(n, dtype=np.float64)
+            if n:
+                for kind in KINDS:
+                    scores -= np.log2(self.counts[kind][self.codes[kind][:n]] / n)
+            self._scores = scores
+        return self._scores
+
+    @property
+    def ranks(self) -> np.ndarray:
+        if self._ranks is None:
+            scores = self.scores
+            order = np.lexsort((self.numbers[:self.size], -scores))
+            ranks = np.empty(self.size, dtype=np.int32)
+            ranks[order] = np.arange(1, self.size + 1, dtype=np.int32)
+            self._ranks = ranks
+        return self._ranks
+
+    def chance_scores(self) -> np.ndarray:
+        # Rarity by the chances the site publishes (in hundredths of a percent), independent of what we have crawled.
+        n = self.size
+        scores = np.zeros(n, dtype=np.float64)
+        for kind in KINDS:
+            scores -= np.log2(np.maximum(self.chances[kind][:n], 1) / 10000)
+        return scores
+
+    def _row(self, number: int) -> int:
+        if number < 0 or number >= len(self.positions) or self.positions[number] < 0:
+            raise KeyError(number)
+        return int(self.positions[number])
+
+    def rank_of(self, number: int) -> int:
+        return int(self.ranks[self._row(number)])
+
+    def lookup(self, number: int) -> dict:
+        row = self._row(number)
+        item = {"number": number, "score": float(self.scores[row]), "rank": int(self.ranks[row])}
+        for kind in KINDS:
+            code = self.codes[kind][row]
+            item[kind] = self.vocab[kind].values[code]
+            item[f"{kind}_count"] = int(self.counts[kind][code])
+        return item
+
+    def top(self, limit: int = 10) -> list:
+        ranks = self.ranks
+        limit = min(limit, self.size)
+        if not limit:
+            return []
+        rows = np.argpartition(ranks, limit - 1)[:limit]
+        rows = rows[np.argsort(ranks[rows])]
+        return [self.lookup(int(self.numbers[row])) for row in rows]
+
+    def snapshot(self) -> dict:
+        # Copies, not views: extend() updates rows in place, so a save on another thread
+        # writes this snapshot while the index keeps changing.
+        n = self.size
+        arrays = {"numbers": self.numbers[:n].copy(), "synced_at": np.int64(self.synced_at)}
+        for kind in KINDS:
+            arrays[f"codes_{kind}"] = self.codes[kind][:n].copy()
+            arrays[f"chances_{kind}"] = self.chances[kind][:n].copy()
+            arrays[f"vocab_{kind}"] = np.array(self.vocab[kind].values, dtype=str)
+        return arrays
+
+    def save(self, path):
+        save_snapshot(self.snapshot(), path)
+
+    @classmethod
+    def load(cls, path, table_name: str) -> "RarityIndex":
+        index = cls(table_name)
+        with np.load(path) as data:
+            if "synced_at" not in data:
+                raise ValueError("written before change tracking")
+            index.synced_at = int(data["synced_at"])
+            numbers = data["numbers"]
+            n = len(numbers)
+            index._reserve(n)
+            index.numbers[:n] = numbers
+            for kind in KINDS:
+                index.vocab[kind] = _Vocabulary(data[f"vocab_{kind}"].tolist())
+                index.codes[kind][:n] = data[f"codes_{kind}"]
+                index.chances[kind][:n] = data[f"chances_{kind}"]
+                index.counts[kind] = np.bincount(index.codes[kind][:n], minlength=len(index.vocab[kind])).astype(np.int64)
+        index.size = n
+        if n:
+            index._reserve_numbers(int(numbers.max()))
+            index.positions[numbers] = np.arange(n, dtype=np.int64)
+        return index
+
+def save_snapshot(arrays: dict, path):
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def read_rows(pool, table_name: str, name: str, since: int = 0, fetch_size: int = None):
+    fetch_size = fetch_size or get_settings().rarity_fetch_size
+    columns = ", ".join(ROW_COLUMNS)
+    if not since:
+        query, args = f"SELECT {columns} FROM `{table_name}` WHERE name = %s ORDER BY number", (name,)
+    else:
+        query = f"SELECT {columns} FROM `{table_name}` WHERE name = %s AND updated_at >= FROM_UNIXTIME(%s)"
+        args = (name, since)
+    return stream_rows(pool, query, args, fetch_size)
+
+async def _fetch_value(pool, query: str, args=()):
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(query, args)
+            (value,) = await cur.fetchone()
+    return value
+
+async def sync_rarity_index(pool, index: RarityIndex, name: str) -> int:
+    # Inserts, dead-letter retries, resumed holes and refreshed traits all bump updated_at.
+    now = int(await _fetch_value(pool, "SELECT UNIX_TIMESTAMP()"))
+    changed = 0
+    async for rows in read_rows(pool, index.table_name, name, index.synced_at):
+        changed += index.extend_rows(rows)
+    index.synced_at = now - SYNC_MARGIN
+    return changed
+
+async def load_rarity_index(pool, table_name: str, name: str, cache_path=None) -> RarityIndex:
+    start = time.perf_counter()
+    index = None
+    if cache_path and Path(cache_path).exists():
+        try:
+            index = RarityIndex.load(cache_path, table_name)
+        except Exception as e:
+            logger.warning(f"[{table_name}] Rarity cache `{cache_path}` is unreadable, rebuilding: {e}")
+    if index is not None:
+        changed = await sync_rarity_index(pool, index, name)
+        # Rows are never deleted, so a count mismatch means the table was rebuilt or the cache belongs elsewhere.
+        count = await _fetch_value(pool, f"SELECT COUNT(*) FROM `{table_name}` WHERE name = %s", (name,))
+        if count != len(index):
+            logger.warning(f"[{table_name}] Rarity cache `{cache_path}` has {len(index)} items, the table {count}; rebuilding")
+            index = None
+    cached = index is not None
+    if index is None:
+        index = RarityIndex(table_name)
+        changed = await sync_rarity_index(pool, index, name)
+    logger.info(f"[{table_name}] Rarity index: {len(index)} items, {changed} {'changed' if cached else 'loaded'} "
+                f"in {time.perf_counter() - start:.2f}s")
+    if cache_path and (changed or not cached):
+        await asyncio.to_thread(index.save, cache_path)
+    return index
+
+async def main(table_name: str, number=None, top: int = 10, refresh: bool = False):
+    from collection import Collection, name_from_table
+
+    pool = await create_pool()
+    try:
+        name = await read_collection_name(pool, table_name) or name_from_table(table_name) or table_name
+        collection = Collection(name, table_name=table_name)
+        cache_path = collection.rarity_path
+        if refresh and cache_path.exists():
+            cache_path.unlink()
+        index = await load_rarity_index(pool, table_name, collection.name, cache_path)
+    finally:
+        pool.close()
+        await pool.wait_closed()
+
+    if number is not None:
+        print(index.lookup(number))
+        return
+    for kind in KINDS:
+        rarest = list(index.frequencies(kind).items())[:5]
+        print(f"{kind}: {len(index.vocab[kind])} values, rarest: " + ", ".join(f"{value} ({count})" for value, (count, _) in rarest))
+    for item in index.top(top):
+        print(f"#{item['rank']} {collection.name}-{item['number']}: {item['score']:.2f} bits, {item['m']} / {item['bd']} / {item['s']}")
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Trait frequencies and rarity ranks for a collection")
+    parser.add_argument("table_name")
+    parser.add_argument("--number", type=int, help="show a single item")
+    parser.add_argument("--top", type=int, default=10, help="number of rarest items to list")
+    parser.add_argument("--refresh", action="store_true", help="ignore the cached index")
+    args = parser.parse_args()
+    asyncio.run(main(args.table_name, args.number, args.top, args.refresh))
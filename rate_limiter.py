@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+def parse_retry_after(value) -> float:
+    if not value:
+        return 0.0
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+class AdaptiveRateLimiter:
+    def __init__(
+        self,
+        rate: float,
+        min_rate: float = 1.0,
+        max_rate: float = 1000.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_target: float = 2.0,
+        cooldown: float = 1.0,
+    ):
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self._next_slot, self._paused_until)
+        self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    def _back_off(self, factor: float) -> bool:
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return False
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * factor)
+        self._next_slot = max(self._next_slot, now + 1 / self.rate)
+        return True
+
+    def record(self, status: int, latency: float, retry_after: float = 0.0):
+        if status == 429 or status >= 500:
+            lowered = self._back_off(self.decrease)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            if lowered:
+                logger.warning(f"Status {status}: rate lowered to {self.rate:.1f} req/s"
+                               + (f", paused for {retry_after:.1f}s" if retry_after else ""))
+        elif latency > self.latency_target:
+            self._back_off((1 + self.decrease) / 2)
+        else:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def record_error(self):
+        self._back_off(self.decrease)
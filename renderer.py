@@ -0,0 +1,165 @@
+import argparse
+import gzip
+import io
+import logging
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import NamedTuple
+
+from settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"webp": "WEBP", "png": "PNG"}
+
+class ModelOutputs(NamedTuple):
+    tgs: Path
+    png: Path
+    json: Path
+    previews: dict
+
+    def rendered(self) -> list:
+        return [self.png, self.json, *self.previews.values()]
+
+def model_outputs(collection, name: str, sizes=None, fmt: str = None) -> ModelOutputs:
+    settings = get_settings()
+    sizes = settings.preview_sizes if sizes is None else sizes
+    fmt = fmt or settings.preview_format
+    return ModelOutputs(
+        collection.tgs_dir / f"{name}.tgs",
+        collection.img_dir / f"{name}.png",
+        collection.anim_dir / f"{name}.json",
+        {size: collection.preview_dir / f"{name}_{size}.{fmt}" for size in sizes},
+    )
+
+def is_up_to_date(source, outputs) -> bool:
+    try:
+        mtime = os.stat(source).st_mtime
+        return all(os.stat(path).st_mtime >= mtime for path in outputs)
+    except FileNotFoundError:
+        return False
+
+def frame_indices(total: int, count: int) -> list:
+    count = max(1, min(count, total))
+    return [i * total // count for i in range(count)]
+
+def fit(width: int, height: int, size: int) -> tuple:
+    # `size` bounds the longer side; the shorter one keeps the animation's aspect ratio.
+    scale = size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def write_tgs_as_json(tgs_data: bytes, json_filename) -> None:
+    with gzip.GzipFile(fileobj=io.BytesIO(tgs_data)) as gz, open(json_filename, "wb") as f:
+        shutil.copyfileobj(gz, f, 64 * 1024)
+
+def webp_options(quality: int = None) -> dict:
+    settings = get_settings()
+    return {"quality": quality or settings.preview_quality, "method": settings.preview_webp_method}
+
+def _save_image(image, path, fmt: str, quality: int = None):
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    options = webp_options(quality) if fmt == "webp" else {}
+    image.save(tmp_path, format=FORMATS[fmt], **options)
+    os.replace(tmp_path, path)
+
+def sprite_sheet(anim, frames: list, width: int, height: int, columns: int = None):
+    from PIL import Image
+
+    columns = get_settings().preview_columns if columns is None else columns
+    columns = columns or math.ceil(math.sqrt(len(frames)))
+    rows = math.ceil(len(frames) / columns)
+    sheet = Image.new("RGBA", (width * columns, height * rows))
+    for i, frame in enumerate(frames):
+        buf = anim.lottie_animation_render(frame_num=frame, width=width, height=height)
+        tile = Image.frombuffer("RGBA", (width, height), buf, "raw", "BGRA")
+        sheet.paste(tile, ((i % columns) * width, (i // columns) * height))
+    return sheet
+
+def render_model(tgs_data: bytes, png_path=None, previews=None, frames: int = None,
+                 fmt: str = None, columns: int = None) -> int:
+    from rlottie_python import LottieAnimation
+    from PIL import Image
+
+    settings = get_settings()
+    frames = settings.preview_frames if frames is None else frames
+    fmt = fmt or settings.preview_format
+    written = 0
+    with LottieAnimation.from_tgs(io.BytesIO(tgs_data)) as anim:
+        width, height = anim.lottie_animation_get_size()
+        if png_path:
+            buf = anim.lottie_animation_render(frame_num=0)
+            _save_image(Image.frombuffer("RGBA", (width, height), buf, "raw", "BGRA"), png_path, "png")
+            written += 1
+        indices = frame_indices(anim.lottie_animation_get_totalframe(), frames)
+        for size, path in (previews or {}).items():
+            _save_image(sprite_sheet(anim, indices, *fit(width, height, size), columns), path, fmt)
+            written += 1
+    return written
+
+def render_saved_model(outputs: ModelOutputs, frames: int = None, fmt: str = None,
+                       columns: int = None, force: bool = False) -> int:
+    def stale(path) -> bool:
+        return force or not is_up_to_date(outputs.tgs, [path])
+
+    tgs_data = outputs.tgs.read_bytes()
+    if stale(outputs.json):
+        write_tgs_as_json(tgs_data, outputs.json)
+    previews = {size: path for size, path in outputs.previews.items() if stale(path)}
+    return render_model(tgs_data, outputs.png if stale(outputs.png) else None, previews, frames, fmt, columns)
+
+def render_collection(collection, sizes=None, frames: int = None, fmt: str = None,
+                      columns: int = None, workers: int = None, force: bool = False) -> dict:
+    settings = get_settings()
+    sizes = settings.preview_sizes if sizes is None else sizes
+    fmt = fmt or settings.preview_format
+    collection.prepare_dirs()
+    stats = {"rendered": 0, "skipped": 0, "failed": 0}
+    pending = []
+    for tgs_path in sorted(collection.tgs_dir.glob("*.tgs")):
+        outputs = model_outputs(collection, tgs_path.stem, sizes, fmt)
+        if not force and is_up_to_date(tgs_path, outputs.rendered()):
+            stats["skipped"] += 1
+            continue
+        pending.append(outputs)
+
+    logger.info(f"[{collection.table_name}] Rendering {len(pending)} models, {stats['skipped']} up to date")
+    with ProcessPoolExecutor(max_workers=workers or settings.render_workers) as executor:
+        futures = {executor.submit(render_saved_model, outputs, frames, fmt, columns, force): outputs for outputs in pending}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                stats["rendered"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"Render error for {futures[future].tgs.stem}: {e}")
+    return stats
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from collection import Collection
+
+    load_dotenv()
+    settings = get_settings()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Render model previews and sprite sheets from saved .tgs files")
+    parser.add_argument("nft_name", nargs="?", help="collection to render; defaults to NFT_NAME")
+    parser.add_argument("--sizes", default=",".join(map(str, settings.preview_sizes)) or "128", help="comma-separated sizes, px")
+    parser.add_argument("--frames", type=int, default=settings.preview_frames, help="frames per sprite sheet")
+    parser.add_argument("--columns", type=int, default=settings.preview_columns, help="sprite sheet columns; 0 for a square grid")
+    parser.add_argument("--format", choices=sorted(FORMATS), default=settings.preview_format)
+    parser.add_argument("--force", action="store_true", help="re-render models whose outputs are up to date")
+    args = parser.parse_args()
+
+    collection = Collection(args.nft_name) if args.nft_name else Collection.from_env()
+    sizes = tuple(int(size) for size in args.sizes.split(",") if size.strip())
+    start = time.time()
+    stats = render_collection(collection, sizes, args.frames, args.format, args.columns,
+                              settings.render_workers, args.force)
+    logger.info(f"Rendered {stats['rendered']}, skipped {stats['skipped']}, failed {stats['failed']} "
+                f"in {time.time() - start:.2f}s")
@@ -0,0 +1,41 @@
+import logging
+import time
+
+from collection import Collection
+from gift_parser import parse_gift_page, record_from_page
+from http_client import FetchStatusError
+from metrics import PARSE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+async def get_current_quantity(fetcher, collection: Collection):
+    content = await fetcher.get_bytes(collection.page_url(1), cache=False)
+    qty = parse_gift_page(content).quantity
+    if qty is None:
+        logger.error("Quantity field not found")
+        raise RuntimeError("Quantity field not found")
+    return qty
+
+async def fetch_page(fetcher, collection: Collection, idx):
+    url = collection.page_url(idx)
+    try:
+        # Each crawled page is read once: the asset stages take the .tgs and pattern URLs parsed from it.
+        return idx, await fetcher.get_bytes(url, cache=False)
+    except FetchStatusError as e:
+        logger.warning(f"[{idx}] Status {e.status} for {url}")
+        raise
+    except Exception as e:
+        logger.error(f"[{idx}] Request error for {url}: {e}")
+        raise
+
+async def parse_page(fetcher, collection: Collection, idx):
+    _, content = await fetch_page(fetcher, collection, idx)
+    started = time.perf_counter()
+    page = parse_gift_page(content)
+    d = record_from_page(collection.name, idx, page)
+    PARSE_LATENCY.observe(time.perf_counter() - started)
+    collection.remember_assets(d, page.tgs_url, page.pattern_url)
+
+    logger.debug(f"Parsed NFT ID: {idx}, Model: {d.m} ({d.mchance/100:.1f}%), Backdrop: {d.bd} ({d.bdchance/100:.1f}%), Symbol: {d.s} ({d.schance/100:.1f}%), Gradient: {d.hex1}, {d.hex2}")
+
+    return idx, d
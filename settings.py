@@ -0,0 +1,190 @@
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+def _flag(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+def _sizes(value) -> tuple:
+    return tuple(int(size) for size in str(value or "").split(",") if size.strip())
+
+@dataclass
+class Settings:
+    # Crawl
+    batch_size: int = 70
+    workers: Optional[int] = None
+    flush_interval: float = 1.0
+    model_concurrency: int = 8
+    render_workers: Optional[int] = None
+    parse_workers: int = 0
+    parse_chunk: int = 64
+    symbol_concurrency: int = 16
+    refresh_block: int = 10000
+    trait_summary: bool = False
+    rarity_index: bool = False
+    rarity_fetch_size: int = 50000
+
+    # Collections and storage
+    nft_name: Optional[str] = None
+    base_url: Optional[str] = None
+    table_name: str = "{NFT_NAME_LOWER}"
+    storage_root: Path = Path("storage")
+    manifest_path: str = "collections.json"
+    max_parallel_collections: int = 4
+
+    # HTTP
+    user_agent: str = "Mozilla/5.0"
+    rate: float = 70.0
+    min_rate: float = 1.0
+    max_rate: float = 1000.0
+    rate_increase: float = 1.0
+    rate_decrease: float = 0.5
+    latency_target: float = 2.0
+    http_limit: int = 200
+    http_limit_per_host: int = 100
+    dns_cache_ttl: int = 300
+    keepalive_timeout: int = 30
+    cache_size: int = 4096
+    trace_sample_rate: float = 0.0
+    trace_slow_seconds: float = 2.0
+
+    # MySQL
+    db_host: str = "localhost"
+    db_user: Optional[str] = None
+    db_password: Optional[str] = field(default=None, repr=False)
+    db_name: str = "nfts"
+    db_port: int = 3306
+    db_load_mode: str = "multirow"
+    db_chunk_size: int = 1000
+    db_fetch_size: int = 5000
+    dead_letter_base_delay: int = 30
+    dead_letter_max_delay: int = 6 * 3600
+    dead_letter_max_attempts: int = 10
+    retry_workers: int = 2
+    retry_interval: int = 60
+    retry_batch: int = 500
+
+    # Export
+    export_format: str = "csv"
+    export_buffer_rows: int = 10000
+    export_compression_level: Optional[int] = None
+
+    # Previews
+    preview_sizes: tuple = ()
+    preview_frames: int = 1
+    preview_columns: int = 0
+    preview_format: str = "webp"
+    preview_quality: int = 90
+    # libwebp effort, 0-6: 2 encodes about three times faster than the default 4 for a few percent in size.
+    preview_webp_method: int = 2
+
+    # Updater
+    min_poll_interval: float = 1.0
+    max_poll_interval: float = 300.0
+    tables_refresh_interval: float = 60.0
+
+    # Metrics
+    metrics_port: int = 0
+    metrics_host: str = "127.0.0.1"
+    metrics_interval: float = 10.0
+
+    def __post_init__(self):
+        self.workers = self.workers or self.batch_size
+        self.render_workers = self.render_workers or os.cpu_count() or 1
+        self.storage_root = Path(self.storage_root)
+
+    @property
+    def patterns_dir(self) -> Path:
+        return self.storage_root / "patterns"
+
+    @property
+    def symbols_path(self) -> Path:
+        return self.patterns_dir / "symbols.json"
+
+    @property
+    def symbols_registry_path(self) -> Path:
+        return self.patterns_dir / "symbols.sqlite3"
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        # Reads os.environ only; entry points call load_dotenv() before the first get_settings().
+        env = os.environ
+        compression_level = env.get("EXPORT_COMPRESSION_LEVEL")
+        return cls(
+            batch_size=int(env.get("BATCH_SIZE") or 70),
+            workers=int(env.get("WORKERS") or 0) or None,
+            flush_interval=float(env.get("FLUSH_INTERVAL") or 1),
+            model_concurrency=int(env.get("MODEL_CONCURRENCY") or 8),
+            render_workers=int(env.get("RENDER_WORKERS") or 0) or None,
+            parse_workers=int(env.get("PARSE_WORKERS") or 0),
+            parse_chunk=int(env.get("PARSE_CHUNK") or 64),
+            symbol_concurrency=int(env.get("SYMBOL_CONCURRENCY") or 16),
+            refresh_block=int(env.get("REFRESH_BLOCK") or 10000),
+            # NORMALIZE_TRAITS is the old name of the flag.
+            trait_summary=_flag(env.get("TRAIT_SUMMARY", env.get("NORMALIZE_TRAITS", "0"))),
+            rarity_index=_flag(env.get("RARITY_INDEX", "0")),
+            rarity_fetch_size=int(env.get("RARITY_FETCH_SIZE") or 50000),
+
+            nft_name=env.get("NFT_NAME") or None,
+            base_url=env.get("BASE_URL") or None,
+            table_name=env.get("TABLE_NAME") or "{NFT_NAME_LOWER}",
+            storage_root=Path(env.get("STORAGE_ROOT") or "storage"),
+            manifest_path=env.get("MANIFEST_PATH") or "collections.json",
+            max_parallel_collections=int(env.get("MAX_PARALLEL_COLLECTIONS") or 4),
+
+            user_agent=(env.get("HEADERS") or "User-Agent: Mozilla/5.0").split(": ")[-1],
+            rate=int(env.get("RATE_LIMIT") or 70) / int(env.get("PERIOD") or 1),
+            min_rate=float(env.get("MIN_RATE") or 1),
+            max_rate=float(env.get("MAX_RATE") or 1000),
+            rate_increase=float(env.get("RATE_INCREASE") or 1),
+            rate_decrease=float(env.get("RATE_DECREASE") or 0.5),
+            latency_target=float(env.get("LATENCY_TARGET") or 2),
+            http_limit=int(env.get("HTTP_LIMIT") or 200),
+            http_limit_per_host=int(env.get("HTTP_LIMIT_PER_HOST") or 100),
+            dns_cache_ttl=int(env.get("DNS_CACHE_TTL") or 300),
+            keepalive_timeout=int(env.get("KEEPALIVE_TIMEOUT") or 30),
+            cache_size=int(env.get("CACHE_SIZE") or 4096),
+            trace_sample_rate=float(env.get("TRACE_SAMPLE_RATE") or 0),
+            trace_slow_seconds=float(env.get("TRACE_SLOW_SECONDS") or 2),
+
+            db_host=env.get("DB_HOST") or "localhost",
+            db_user=env.get("DB_USER") or None,
+            db_password=env.get("DB_PASSWORD") or None,
+            db_name=env.get("DB_NAME") or "nfts",
+            db_port=int(env.get("DB_PORT") or 3306),
+            db_load_mode=env.get("DB_LOAD_MODE") or "multirow",
+            db_chunk_size=int(env.get("DB_CHUNK_SIZE") or 1000),
+            db_fetch_size=int(env.get("DB_FETCH_SIZE") or 5000),
+            dead_letter_base_delay=int(env.get("DEAD_LETTER_BASE_DELAY") or 30),
+            dead_letter_max_delay=int(env.get("DEAD_LETTER_MAX_DELAY") or 6 * 3600),
+            dead_letter_max_attempts=int(env.get("DEAD_LETTER_MAX_ATTEMPTS") or 10),
+            retry_workers=int(env.get("RETRY_WORKERS") or 2),
+            retry_interval=int(env.get("RETRY_INTERVAL") or 60),
+            retry_batch=int(env.get("RETRY_BATCH") or 500),
+
+            export_format=env.get("EXPORT_FORMAT") or "csv",
+            export_buffer_rows=int(env.get("EXPORT_BUFFER_ROWS") or 10000),
+            export_compression_level=int(compression_level) if compression_level else None,
+
+            preview_sizes=_sizes(env.get("PREVIEW_SIZES")),
+            preview_frames=int(env.get("PREVIEW_FRAMES") or 1),
+            preview_columns=int(env.get("PREVIEW_COLUMNS") or 0),
+            preview_format=(env.get("PREVIEW_FORMAT") or "webp").lower(),
+            preview_quality=int(env.get("PREVIEW_QUALITY") or 90),
+            preview_webp_method=int(env.get("PREVIEW_WEBP_METHOD") or 2),
+
+            min_poll_interval=float(env.get("MIN_POLL_INTERVAL") or 1),
+            max_poll_interval=float(env.get("MAX_POLL_INTERVAL") or 300),
+            tables_refresh_interval=float(env.get("TABLES_REFRESH_INTERVAL") or 60),
+
+            metrics_port=int(env.get("METRICS_PORT") or 0),
+            metrics_host=env.get("METRICS_HOST") or "127.0.0.1",
+            metrics_interval=float(env.get("METRICS_INTERVAL") or 10),
+        )
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    # Built on first use, so importing a module never reads the environment.
+    return Settings.from_env()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class SymbolRegistry:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS symbols (
+                symbol TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, symbol: str) -> Optional[str]:
+        row = self.conn.execute("SELECT path FROM symbols WHERE symbol = ?", (symbol,)).fetchone()
+        return row[0] if row else None
+
+    def __getitem__(self, symbol: str) -> str:
+        path = self.get(symbol)
+        if path is None:
+            raise KeyError(symbol)
+        return path
+
+    def __setitem__(self, symbol: str, path: str):
+        self.conn.execute(
+            "INSERT INTO symbols (symbol, path) VALUES (?, ?) "
+            "ON CONFLICT(symbol) DO UPDATE SET path = excluded.path",
+            (symbol, str(path))
+        )
+
+    def __contains__(self, symbol: str) -> bool:
+        return self.get(symbol) is not None
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
+
+    def items(self):
+        return self.conn.execute("SELECT symbol, path FROM symbols ORDER BY symbol").fetchall()
+
+    def import_json(self, json_path) -> int:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with self.conn:
+            self.conn.execute("BEGIN")
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO symbols (symbol, path) VALUES (?, ?)",
+                [(symbol, str(path)) for symbol, path in data.items()]
+            )
+            imported = self.conn.total_changes - before
+        logger.info(f"Imported {imported} of {len(data)} symbols from {json_path}")
+        return imported
+
+    def export_json(self, json_path) -> int:
+        data = dict(self.items())
+        tmp_path = Path(str(json_path) + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, json_path)
+        logger.info(f"Exported {len(data)} symbols to {json_path}")
+        return len(data)
+
+def open_registry(registry_path, legacy_json_path=None) -> SymbolRegistry:
+    registry = SymbolRegistry(registry_path)
+    if legacy_json_path and len(registry) == 0 and Path(legacy_json_path).exists():
+        registry.import_json(legacy_json_path)
+    return registry
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    from settings import get_settings
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    load_dotenv()
+    patterns_dir = get_settings().patterns_dir
+
+    parser = argparse.ArgumentParser(description="Symbol registry import/export")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("json_path", nargs="?", type=Path, default=patterns_dir / "symbols.json")
+    parser.add_argument("--registry", type=Path, default=patterns_dir / "symbols.sqlite3")
+    args = parser.parse_args()
+
+    with SymbolRegistry(args.registry) as registry:
+        if args.command == "import":
+            registry.import_json(args.json_path)
+        else:
+            registry.export_json(args.json_path)
@@ -0,0 +1,51 @@
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import NFT_COLUMNS, NFT_UPSERT
+
+def _assignments(upsert: str) -> list:
+    body = upsert.split("UPDATE", 1)[1]
+    parts, depth, current = [], 0, ""
+    for char in body:
+        depth += (char == "(") - (char == ")")
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    parts.append(current)
+    return [tuple(part.strip().split(" = ", 1)) for part in parts]
+
+def upsert_row(old: dict, new: dict) -> dict:
+    # Applies NFT_UPSERT the way MySQL does: left to right, each assignment seeing the ones before it.
+    # The expressions are evaluated by SQLite once the MySQL-only syntax is translated.
+    row = dict(old)
+    with sqlite3.connect(":memory:") as conn:
+        for column, expr in _assignments(NFT_UPSERT):
+            expr = re.sub(r"VALUES\((\w+)\)", r":new_\1", expr)
+            expr = re.sub(rf"(?<![:_])\b({'|'.join(NFT_COLUMNS)})\b", r":old_\1", expr)
+            expr = expr.replace("<=>", "IS").replace("IF(", "iif(")
+            params = {f"new_{key}": value for key, value in new.items()}
+            params.update({f"old_{key}": value for key, value in row.items()})
+            (row[column],) = conn.execute(f"SELECT {expr}", params).fetchone()
+    return row
+
+def _record(s: str, s_in_dir=None) -> dict:
+    return dict(zip(NFT_COLUMNS, ("Plush Pepe", 1, "Model", "Backdrop", s, 10, 20, 30, "#000000", "#ffffff", s_in_dir)))
+
+def test_changed_symbol_clears_pattern_dir():
+    row = upsert_row(_record("Old Symbol", "ab1234"), _record("New Symbol"))
+    assert row["s"] == "New Symbol"
+    assert row["s_in_dir"] is None
+
+def test_same_symbol_keeps_pattern_dir():
+    row = upsert_row(_record("Symbol", "ab1234"), _record("Symbol"))
+    assert row["s_in_dir"] == "ab1234"
+
+def test_new_pattern_dir_replaces_old_one():
+    row = upsert_row(_record("Symbol", "ab1234"), _record("Symbol", "cd5678"))
+    assert row["s_in_dir"] == "cd5678"